@@ -1,11 +1,15 @@
 from src.unite_talking_points.domain.repositories.file_document_repository.file_document_repository import \
     FileDocumentRepository
+from src.unite_talking_points.domain.repositories.sharded_document_repository.sharded_document_repository import \
+    ShardedDocumentRepository
 from src.unite_talking_points.domain.services.generation_service.generation_service import GenerationService
 from src.unite_talking_points.domain.services.query_service.query_service import QueryService
 from src.unite_talking_points.domain.services.summary_service.summary_service import SummaryService
 from src.unite_talking_points.utils.application.interfaces.console_utils import print_word_art, \
-    print_document_query_results
+    print_document_query_results, parse_query_filters, print_setup_progress, print_llm_usage
 from src.unite_talking_points.utils.config.config_loader import ConfigLoader
+from src.unite_talking_points.utils.infrastructure.llm_usage import LLMUsage
+from src.unite_talking_points.utils.nlp.extractive import TextRankSummarizer
 
 
 def main():
@@ -22,12 +26,24 @@ def main():
         end_of_program = False
         try:
             top_n = int(config["Application-console"]["top_n"])
+            n_shards = int(config["Application-console"].get("n_shards", 1))
+            query_cache_size = int(config["Application-console"].get("query_cache_size", 256))
+            streaming_batch_size = int(config["Application-console"].get("streaming_batch_size", 0))
+            pipeline_batch_size = int(config["Application-console"].get("pipeline_batch_size", 0))
+            summary_batch_size = int(config["Application-console"].get("summary_batch_size", 0)) or None
+            summary_strategy = str(config["Application-console"].get("summary_strategy", "map_reduce"))
+            summary_sentences = int(config["Application-console"].get("summary_sentences", 5))
+            condense_sentences = int(config["Application-console"].get("condense_sentences", 0)) or None
             openai_api_key = str(config["External-services"]["openai_api_key"])
+            llm_usage_path = str(config["Application-console"].get("llm_usage_path", ""))
         except TypeError:
             print("TypeError occurred while loading configuration")
         else:
             print("Configuration loaded successfully")
 
+            # LLM calls of the whole console session
+            session_usage = LLMUsage()
+
             while not end_of_program:
                 print()
                 print()
@@ -39,7 +55,12 @@ def main():
                 # For both options we will need the repository
                 if choice1 == "1" or choice1 == "2":
 
-                    repository = FileDocumentRepository(config['Directories']['documents_path'])
+                    if n_shards > 1:
+                        repository = ShardedDocumentRepository(config['Directories']['documents_path'], n_shards,
+                                                               query_cache_size=query_cache_size)
+                    else:
+                        repository = FileDocumentRepository(config['Directories']['documents_path'],
+                                                            query_cache_size=query_cache_size)
 
                     if choice1 == "1":
                         print()
@@ -54,11 +75,21 @@ def main():
                         print()
                         print("Setting up repository...")
 
-                        repository.setup()
+                        if streaming_batch_size > 0 and n_shards <= 1:
+                            repository.setup_streaming(batch_size=streaming_batch_size)
+                        elif pipeline_batch_size > 0 and n_shards <= 1:
+                            repository.setup_pipelined(batch_size=pipeline_batch_size,
+                                                       progress=print_setup_progress)
+                            print()
+                        else:
+                            repository.setup()
                         repository.save()
                         print(f"Repository with {len(repository)} documents and vectors was created")
 
                     if repository:
+                        # Local summarizer of the extractive strategy, using the vectorizer of the repository
+                        summarizer = TextRankSummarizer(repository.vectorizer, repository.analyzer, summary_sentences)
+
                         while not end_of_program:
                             print()
                             print()
@@ -72,18 +103,30 @@ def main():
                                 print()
                                 print()
                                 query = str(input("Enter your query: "))
+                                authors = str(input("Filter by authors separated by commas (leave empty for all): "))
+                                created_from = str(input("Created from YYYY-MM-DD (leave empty for no limit): "))
+                                created_to = str(input("Created until YYYY-MM-DD (leave empty for no limit): "))
 
-                                # Perform the query
-                                print()
-                                print()
-                                print("Querying documents...")
-                                query_service = QueryService(query, repository)
-                                query_indexes = query_service.run()
+                                try:
+                                    filters = parse_query_filters(authors, created_from, created_to)
+
+                                except ValueError:
+                                    print("Invalid date. Please enter a valid date.")
 
-                                # Print top n relevant documents
-                                query_results = repository[query_indexes[:top_n]]
-                                query_indexes = query_indexes[:top_n]
-                                print_document_query_results(query_results, query_indexes)
+                                else:
+                                    # Perform the query
+                                    print()
+                                    print()
+                                    print("Querying documents...")
+                                    query_service = QueryService(query, repository, top_n, filters)
+                                    query_indexes = query_service.run()
+
+                                    # Print top n relevant documents
+                                    query_results = repository[query_indexes]
+                                    print_document_query_results(query_results, query_indexes)
+
+                                    cache_stats = repository.query_cache.stats()
+                                    print(f"Query cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
                             elif choice2 == "2":
                                 # Search the document to be summarized
@@ -112,8 +155,20 @@ def main():
                                         print("Summarizing document...")
 
                                         # Summarize the document
-                                        summary_service = SummaryService(document, openai_api_key)
+                                        summary_service = SummaryService(
+                                            document, openai_api_key, summary_batch_size, strategy=summary_strategy,
+                                            summarizer=summarizer, condense_sentences=condense_sentences
+                                        )
                                         summary_result = summary_service.run()
+                                        print(f"Summarized with the {summary_service.path} path in "
+                                              f"{summary_service.llm_calls} LLM calls")
+
+                                        session_usage.extend(summary_service.usage)
+                                        print_llm_usage(summary_service.usage, session_usage)
+                                        if llm_usage_path:
+                                            summary_service.usage.export_jsonl(
+                                                llm_usage_path, session_id=session_usage.request_id
+                                            )
 
                                         print()
                                         print()
@@ -146,11 +201,20 @@ def main():
                                         print("All the documents were found")
                                         print("Summarizing documents...")
 
-                                        # Summarize the documents
+                                        # Summarize the documents, every LLM call is recorded with the request
+                                        request_usage = LLMUsage()
                                         summaries = []
                                         for document in documents:
-                                            summary_service = SummaryService(document, openai_api_key)
+                                            summary_service = SummaryService(
+                                                document, openai_api_key, summary_batch_size,
+                                                strategy=summary_strategy, summarizer=summarizer,
+                                                condense_sentences=condense_sentences,
+                                                request_id=request_usage.request_id
+                                            )
                                             summary_result = summary_service.run()
+                                            print(f"Summarized with the {summary_service.path} path in "
+                                                  f"{summary_service.llm_calls} LLM calls")
+                                            request_usage.extend(summary_service.usage)
                                             summaries.append(summary_result)
 
                                         print()
@@ -197,12 +261,21 @@ def main():
                                         }
 
                                         generation_service = GenerationService(
-                                            summaries, generation_parameters, openai_api_key
+                                            summaries, generation_parameters, openai_api_key,
+                                            request_id=request_usage.request_id
                                         )
                                         generation_result = generation_service.run()
                                         print("GENERATED TALKING POINT:")
                                         print(generation_result)
 
+                                        request_usage.extend(generation_service.usage)
+                                        session_usage.extend(request_usage)
+                                        print()
+                                        print_llm_usage(request_usage, session_usage)
+                                        if llm_usage_path:
+                                            request_usage.export_jsonl(llm_usage_path,
+                                                                       session_id=session_usage.request_id)
+
                             elif choice2 == "4":
                                 end_of_program = True
 
@@ -1,6 +1,71 @@
-from abc import ABC
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+import numpy as np
+
+from src.unite_talking_points.domain.repositories.query_cache import QueryResultCache
 
 
 class AbstractDocumentRepository(ABC):
-    def __init__(self):
+    # Assigning any of these attributes changes the version of the repository
+    VERSIONED_ATTRIBUTES = frozenset({'documents', 'vectors', 'vectorizer', 'analyzer'})
+
+    def __init__(self, query_cache_size: int = 256):
+        """
+        :param query_cache_size: int Maximum number of query results kept in the query cache, disabled when 0.
+        """
+        # Version of the documents and vectors, it changes when they are set up, loaded, updated or replaced
+        self.version = 0
+        self.query_cache = QueryResultCache(query_cache_size)
+
+        # Define the documents
+        self.documents = []
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        # Replacing the documents, vectors, vectorizer or analyzer makes the cached query results stale
+        if name in self.VERSIONED_ATTRIBUTES and 'version' in self.__dict__:
+            self._update_version()
+
+    def _update_version(self):
+        """
+        Change the version of the repository, so the cached query results of the previous version are discarded
+        :return:
+        """
+        self.version += 1
+
+    @abstractmethod
+    def search(self, query_vector, top_k: int = None, rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank the documents by their similarity with a query vector
+        :param query_vector: Sparse matrix with a single row.
+        :param top_k: int Number of documents to return, all of them when None.
+        :param rows: np.ndarray The sorted rows of the candidate documents, all of them when None.
+        :return: indexes: np.ndarray The indexes of the most similar documents in descending order of similarity.
+                 similarities: np.ndarray The similarities of the documents.
+        """
         pass
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __bool__(self):
+        output = False
+
+        if len(self) > 0:
+            return True
+
+        return output
+
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            output = self.documents[index]
+        elif isinstance(index, list):
+            output = [self.documents[i] for i in index]
+        elif isinstance(index, slice):
+            start, stop, step = index.indices(len(self.documents))
+            output = [self.documents[i] for i in range(start, stop, step)]
+        else:
+            raise TypeError("Index must be an integer or a slice")
+        return output
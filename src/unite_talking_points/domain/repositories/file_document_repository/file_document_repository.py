@@ -1,16 +1,46 @@
+import json
 import os
 import pickle
-from typing import Dict, Any
+import queue
+import shutil
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Any, List, Set, Tuple
 
+import numpy as np
 import scipy as sp
+from sklearn.metrics.pairwise import cosine_similarity, linear_kernel
 
+from src.unite_talking_points.domain.entities.entities import Document
 from src.unite_talking_points.domain.repositories.document_repository import AbstractDocumentRepository
+from src.unite_talking_points.domain.repositories.metadata_index import MetadataIndex
 from utils.infrastructure.ingestion import load_documents
-from src.unite_talking_points.utils.nlp.vectorization import vectorize_tfidf
+from src.unite_talking_points.utils.infrastructure.document_store import DocumentStore, DocumentStoreWriter
+from src.unite_talking_points.utils.directory.directory_utils import get_file_paths
+from src.unite_talking_points.utils.infrastructure.ingestion import iter_documents, load_document
+from src.unite_talking_points.utils.infrastructure.sparse_storage import save_csr_matrix, load_csr_matrix, \
+    is_csr_directory, CSRMatrixWriter
+from src.unite_talking_points.utils.nlp.analyzer import LemmaAnalyzer
+from src.unite_talking_points.utils.nlp.ranking import top_k as rank_top_k
+from src.unite_talking_points.utils.nlp.vectorization import vectorize_tfidf, count_document_frequencies, \
+    build_tfidf_vectorizer, fit_tfidf, DocumentFrequencyCounter
+
+# Analyzer of the lemmatization worker processes, so spaCy is loaded once per process
+_worker_analyzer = None
+
+
+def _lemmatize_batch(texts: List[str]) -> Tuple[List[str], Dict[str, Counter], Set[str]]:
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = LemmaAnalyzer()
+
+    return _worker_analyzer.lemmatize_documents(texts)
 
 
 class FileDocumentRepository(AbstractDocumentRepository):
-    def __init__(self, data_path: str):
+    def __init__(self, data_path: str, mmap: bool = True, query_cache_size: int = 256):
         """
         :param data_path: The folder where the documents are stored it needs the following structure:
         <data_path>/
@@ -18,39 +48,62 @@ class FileDocumentRepository(AbstractDocumentRepository):
                 <data_path>/raw/doc1.pdf
                 <data_path>/raw/doc2.word
                 <data_path>/raw/...
-        Then, documents.pkl, vectorizer.pkl and vectors.npz will be created in the data_folder to make the start faster.
+        Then, documents.pkl, metadata.pkl, vectorizer.pkl, analyzer.pkl and vectors/ will be created in the data_folder
+        to make the start faster. vectors/ holds the uncompressed CSR arrays of the tfidf matrix, repositories saved
+        with a vectors.npz file are still loaded. Repositories set up with setup_streaming keep their documents in a
+        documents/ store instead of documents.pkl.
+        :param mmap: bool Whether to memory-map the tfidf matrix when loading it, the processes of a host share it.
+        :param query_cache_size: int Maximum number of query results kept in the query cache, disabled when 0.
         """
-        super().__init__()
+        super().__init__(query_cache_size)
 
         # Define data paths
         self.data_path = data_path
         self.raw_documents_path = os.path.join(self.data_path, 'raw')
-        self.vectors_path = os.path.join(self.data_path, 'vectors.npz')
+        self.vectors_path = os.path.join(self.data_path, 'vectors')
+        self.legacy_vectors_path = os.path.join(self.data_path, 'vectors.npz')
+        self.mmap = mmap
         self.documents_path = os.path.join(self.data_path, 'documents.pkl')
+        self.document_store_path = os.path.join(self.data_path, 'documents')
+        self.lemmatized_path = os.path.join(self.data_path, 'lemmatized.jsonl')
+        self.document_frequencies_path = os.path.join(self.data_path, 'document_frequencies')
+        self.metadata_path = os.path.join(self.data_path, 'metadata.pkl')
         self.vectorizer_path = os.path.join(self.data_path, 'vectorizer.pkl')
+        self.analyzer_path = os.path.join(self.data_path, 'analyzer.pkl')
 
-        # Define the documents and vectors
-        self.documents = []
+        # Define the metadata index and the vectors
+        self.metadata_index = MetadataIndex()
         self.vectors = None
         self.vectorizer = None
+        self.analyzer = None
+
+        # Whether the vectors are already the ones saved in vectors/
+        self._vectors_on_disk = False
 
     # Set up functions
     def setup_documents(self):
         """
-        Load the documents from the raw folder and transform them into a list of Documents
+        Load the documents from the raw folder and transform them into a list of Documents, indexing their metadata
         :return:
         """
         # We read the documents from the raw folder
         self.documents = load_documents(self.raw_documents_path)
 
+        # Index the metadata of the documents
+        self.metadata_index.build(self.documents)
+        self._update_version()
+
     def setup_vectors(self, tfidf_args: Dict[str, Any] = None):
         """
         Vectorize the loaded documents into tfidf vectors
         :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization
         :return:
         """
-        # Vectorize the documents
-        self.vectors, self.vectorizer = vectorize_tfidf(self.documents, tfidf_args)
+        # Vectorize the documents, the analyzer is shared with the queries
+        self.analyzer = LemmaAnalyzer()
+        self.vectors, self.vectorizer = vectorize_tfidf(self.documents, tfidf_args, self.analyzer)
+        self._vectors_on_disk = False
+        self._update_version()
 
     def setup(self, tfidf_args: Dict[str, Any] = None):
         """
@@ -64,27 +117,249 @@ class FileDocumentRepository(AbstractDocumentRepository):
         # Set up the vectors
         self.setup_vectors(tfidf_args)
 
+    def setup_streaming(self, tfidf_args: Dict[str, Any] = None, batch_size: int = 256,
+                        max_counted_terms: int = 1000000):
+        """
+        Set up the documents and vectors of a corpus larger than the memory, by batches of documents.
+
+        The documents are read twice from disk instead of being kept in memory. The first pass writes them to the
+        document store, lemmatizes them and counts the document frequencies of the terms. The counts are written to
+        sorted run files under document_frequencies/ whenever max_counted_terms terms are in memory, and merged from
+        disk to prune the vocabulary. The second pass vectorizes the lemmatized texts and appends the vectors to
+        vectors/, which is memory-mapped afterwards. The vectors are the same as the ones of setup.
+
+        The memory depends on the batch size, max_counted_terms, the pruned vocabulary and the lemma table of the
+        distinct words, but neither on the number of documents nor on the number of distinct n-grams.
+        :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization, max_features is not
+        supported.
+        :param batch_size: int Number of documents held in memory at once.
+        :param max_counted_terms: int Maximum number of terms whose document frequencies are counted in memory.
+        :return:
+        """
+        self.analyzer = LemmaAnalyzer()
+        document_frequencies = DocumentFrequencyCounter(self.document_frequencies_path, max_counted_terms)
+        lemma_counts: Dict[str, Counter] = {}
+        stop_words = set()
+
+        # First pass: store, lemmatize and count the documents
+        documents = iter_documents(self.raw_documents_path)
+        with DocumentStoreWriter(self.document_store_path) as store, \
+                open(self.lemmatized_path, 'w', encoding='utf-8') as lemmatized_file:
+            while True:
+                batch = list(islice(documents, batch_size))
+                if not batch:
+                    break
+
+                for document in batch:
+                    store.append(document)
+
+                lemmatized_texts, batch_lemma_counts, batch_stop_words = self.analyzer.lemmatize_documents(
+                    document.content for document in batch
+                )
+                for text in lemmatized_texts:
+                    lemmatized_file.write(json.dumps(text) + '\n')
+
+                document_frequencies.update(*count_document_frequencies(lemmatized_texts, tfidf_args))
+                for text, counts in batch_lemma_counts.items():
+                    lemma_counts.setdefault(text, Counter()).update(counts)
+                stop_words.update(batch_stop_words)
+
+        # Fit the vocabulary
+        try:
+            self.vectorizer = build_tfidf_vectorizer(document_frequencies.items(), document_frequencies.n_documents,
+                                                     tfidf_args)
+        finally:
+            document_frequencies.close()
+        self.analyzer.build_table(lemma_counts, stop_words)
+        self.analyzer.bind(self.vectorizer)
+
+        # Second pass: vectorize the lemmatized texts
+        writer = CSRMatrixWriter(self.vectors_path, len(self.vectorizer.vocabulary_))
+        with open(self.lemmatized_path, 'r', encoding='utf-8') as lemmatized_file:
+            while True:
+                lines = list(islice(lemmatized_file, batch_size))
+                if not lines:
+                    break
+                writer.append(self.vectorizer.transform([json.loads(line) for line in lines]))
+        writer.close()
+        os.remove(self.lemmatized_path)
+
+        self.vectors = load_csr_matrix(self.vectors_path, mmap=True)
+        self._vectors_on_disk = True
+
+        # The documents are read from the store from now on
+        self.documents = DocumentStore(self.document_store_path)
+        if os.path.isfile(self.documents_path):
+            os.remove(self.documents_path)
+
+        # Index the metadata of the documents
+        self.metadata_index.build(self.documents)
+        self._update_version()
+
+    def setup_pipelined(self, tfidf_args: Dict[str, Any] = None, n_ingestion_workers: int = None,
+                        n_lemmatization_workers: int = None, batch_size: int = 32, queue_size: int = 256,
+                        progress: Callable[[int, int, int], None] = None):
+        """
+        Set up the documents and vectors overlapping the extraction of the documents with their lemmatization.
+
+        Ingestion processes extract the raw documents and feed a bounded queue that is drained in file order by
+        lemmatization processes working on batches of documents. When the lemmatization falls behind, the queue fills
+        up and no more documents are extracted until there is room, so the memory held by the pipeline is bounded.
+        The lemmatized texts are kept for the vectorizer fit, so the documents are lemmatized once. The setup takes
+        about as long as the slower of both stages and the vectors are the same as the ones of setup.
+        :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization
+        :param n_ingestion_workers: int Number of extraction processes. When None, half of the CPUs, or the CPUs left
+        by the lemmatization processes if their number is given.
+        :param n_lemmatization_workers: int Number of lemmatization processes, the CPUs left by the extraction
+        processes when None.
+        :param batch_size: int Number of documents lemmatized together.
+        :param queue_size: int Maximum number of documents extracted but not lemmatized yet.
+        :param progress: Callable[[int, int, int], None] Called with the number of extracted documents, lemmatized
+        documents and files every time a batch is lemmatized.
+        :return:
+        """
+        file_paths = get_file_paths(self.raw_documents_path)
+        extracted_queue = queue.Queue(maxsize=queue_size)
+
+        # Both stages run at the same time, so they share the CPUs
+        n_cpus = os.cpu_count() or 1
+        if n_ingestion_workers is None:
+            n_ingestion_workers = max(1, n_cpus // 2 if n_lemmatization_workers is None
+                                      else n_cpus - n_lemmatization_workers)
+        if n_lemmatization_workers is None:
+            n_lemmatization_workers = max(1, n_cpus - n_ingestion_workers)
+        n_extracted = 0
+        n_lemmatized = 0
+
+        def report_progress():
+            if progress is not None:
+                progress(n_extracted, n_lemmatized, len(file_paths))
+
+        with ProcessPoolExecutor(max_workers=n_ingestion_workers) as ingestion_executor, \
+                ProcessPoolExecutor(max_workers=n_lemmatization_workers) as lemmatization_executor:
+            stopped = threading.Event()
+
+            def put(item) -> bool:
+                # Wait while the queue is full, unless the pipeline was stopped
+                while not stopped.is_set():
+                    try:
+                        extracted_queue.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        pass
+                return False
+
+            # The extractions are queued in file order
+            def feed():
+                for path in file_paths:
+                    if not put(ingestion_executor.submit(load_document, path)):
+                        return
+                put(None)
+
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+
+            documents = []
+            lemmatized_documents = []
+            lemma_counts: Dict[str, Counter] = {}
+            stop_words = set()
+            pending_batches = deque()
+
+            def collect_batch():
+                nonlocal n_lemmatized
+                batch_lemmatized, batch_lemma_counts, batch_stop_words = pending_batches.popleft().result()
+                lemmatized_documents.extend(batch_lemmatized)
+                for text, counts in batch_lemma_counts.items():
+                    lemma_counts.setdefault(text, Counter()).update(counts)
+                stop_words.update(batch_stop_words)
+                n_lemmatized += len(batch_lemmatized)
+                report_progress()
+
+            def submit_batch(batch: List[Document]):
+                # Wait for the oldest batch when every lemmatization worker is busy
+                if len(pending_batches) >= n_lemmatization_workers:
+                    collect_batch()
+                pending_batches.append(lemmatization_executor.submit(
+                    _lemmatize_batch, [document.content for document in batch]
+                ))
+
+            try:
+                # Lemmatize the extracted documents by batches in file order
+                batch = []
+                future = extracted_queue.get()
+                while future is not None:
+                    document = future.result()
+                    n_extracted += 1
+                    if document is not None:
+                        documents.append(document)
+                        batch.append(document)
+
+                    if len(batch) == batch_size:
+                        submit_batch(batch)
+                        batch = []
+
+                    future = extracted_queue.get()
+
+                if batch:
+                    submit_batch(batch)
+                while pending_batches:
+                    collect_batch()
+
+            finally:
+                # A failed stage stops the feeder, so the executors can shut down
+                stopped.set()
+                feeder.join()
+                while not extracted_queue.empty():
+                    future = extracted_queue.get_nowait()
+                    if future is not None:
+                        future.cancel()
+
+        self.documents = documents
+        self.metadata_index.build(self.documents)
+
+        # Fit the vectorizer with the lemmatized texts
+        self.analyzer = LemmaAnalyzer()
+        self.analyzer.build_table(lemma_counts, stop_words)
+        self.vectors, self.vectorizer = fit_tfidf(lemmatized_documents, tfidf_args)
+        self.analyzer.bind(self.vectorizer)
+        self._vectors_on_disk = False
+        self._update_version()
+
     # Save functions
     def save_documents(self):
         """
-        Save the list of Documents into a pickle file
+        Save the list of Documents and their metadata index into pickle files. The documents of a repository set up
+        with setup_streaming are already in the document store.
         :return:
         """
-        with open(self.documents_path, "wb") as file:
-            pickle.dump(self.documents, file)
+        if not isinstance(self.documents, DocumentStore):
+            with open(self.documents_path, "wb") as file:
+                pickle.dump(self.documents, file)
+
+            # Remove the store of a previous streaming set up
+            if os.path.isdir(self.document_store_path):
+                shutil.rmtree(self.document_store_path)
+
+        with open(self.metadata_path, "wb") as file:
+            pickle.dump(self.metadata_index, file)
 
     def save_vectors(self):
         """
-        Save the tfidf vectors into a scipy sparse matrix
+        Save the tfidf vectors as uncompressed CSR arrays
         :return:
         """
-        # Save the vectors
-        sp.sparse.save_npz(self.vectors_path, self.vectors)
+        # Save the vectors, unless they were loaded from or streamed to vectors/
+        if not self._vectors_on_disk:
+            save_csr_matrix(self.vectors_path, self.vectors)
 
         # Save the vectorizer
         with open(self.vectorizer_path, "wb") as file:
             pickle.dump(self.vectorizer, file)
 
+        # Save the analyzer
+        with open(self.analyzer_path, "wb") as file:
+            pickle.dump(self.analyzer, file)
+
     def save(self):
         """
         Save the documents and vectors
@@ -99,24 +374,51 @@ class FileDocumentRepository(AbstractDocumentRepository):
     # Load functions
     def load_documents(self):
         """
-        Load the list of Documents from a pickle file
+        Load the list of Documents and their metadata index from pickle files, or from the document store of a
+        repository set up with setup_streaming
         :return:
         """
-        with open(self.documents_path, "rb") as file:
-            self.documents = pickle.load(file)
+        if not os.path.isfile(self.documents_path) and DocumentStore.exists(self.document_store_path):
+            self.documents = DocumentStore(self.document_store_path)
+        else:
+            with open(self.documents_path, "rb") as file:
+                self.documents = pickle.load(file)
+
+        # Repositories created before the metadata index existed have to build it
+        if os.path.isfile(self.metadata_path):
+            with open(self.metadata_path, "rb") as file:
+                self.metadata_index = pickle.load(file)
+        else:
+            self.metadata_index.build(self.documents)
+
+        self._update_version()
 
     def load_vectors(self):
         """
-        Load the tfidf vectors from a scipy sparse matrix
+        Load the tfidf vectors, memory-mapping the CSR arrays when enabled
         :return:
         """
         # Load the vectors
-        self.vectors = sp.sparse.load_npz(self.vectors_path)
+        if is_csr_directory(self.vectors_path):
+            self.vectors = load_csr_matrix(self.vectors_path, mmap=self.mmap)
+            self._vectors_on_disk = True
+        else:
+            self.vectors = sp.sparse.load_npz(self.legacy_vectors_path)
+            self._vectors_on_disk = False
 
         # Load the vectorizer
         with open(self.vectorizer_path, "rb") as file:
             self.vectorizer = pickle.load(file)
 
+        # Load the analyzer, repositories created before it existed have none
+        self.analyzer = None
+        if os.path.isfile(self.analyzer_path):
+            with open(self.analyzer_path, "rb") as file:
+                self.analyzer = pickle.load(file)
+            self.analyzer.bind(self.vectorizer)
+
+        self._update_version()
+
     def load(self):
         """
         Load the documents and vectors
@@ -128,25 +430,39 @@ class FileDocumentRepository(AbstractDocumentRepository):
         # Load the vectors
         self.load_vectors()
 
-    def __len__(self):
-        return len(self.documents)
+    # Search functions
+    def score(self, query_vector, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Calculate the cosine similarity between a query vector and the document vectors
+        :param query_vector: Sparse matrix with a single row.
+        :param rows: np.ndarray The rows of the documents to score, all of them when None.
+        :return: similarities: np.ndarray The similarity of every scored document.
+        """
+        vectors = self.vectors if rows is None else self.vectors[rows]
 
-    def __bool__(self):
-        output = False
+        # l2 normalized tfidf vectors only need the dot product, so the (possibly memory-mapped) document vectors are
+        # not copied to be normalized
+        if getattr(self.vectorizer, 'norm', None) == 'l2':
+            similarities = linear_kernel(vectors, query_vector)
+        else:
+            similarities = cosine_similarity(vectors, query_vector)
 
-        if len(self) > 0:
-            return True
+        return similarities.flatten()
 
-        return output
+    def search(self, query_vector, top_k: int = None, rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank the documents by their similarity with a query vector, ties are ranked by index
+        :param query_vector: Sparse matrix with a single row.
+        :param top_k: int Number of documents to return, all of them when None.
+        :param rows: np.ndarray The sorted rows of the candidate documents, all of them when None.
+        :return: indexes: np.ndarray The indexes of the most similar documents in descending order of similarity.
+                 similarities: np.ndarray The similarities of the documents.
+        """
+        if rows is not None and len(rows) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
 
-    def __getitem__(self, index):
-        if isinstance(index, int):
-            output = self.documents[index]
-        elif isinstance(index, list):
-            output = [self.documents[i] for i in index]
-        elif isinstance(index, slice):
-            start, stop, step = index.indices(len(self.documents))
-            output = [self.documents[i] for i in range(start, stop, step)]
-        else:
-            raise TypeError("Index must be an integer or a slice")
-        return output
+        similarities = self.score(query_vector, rows)
+        order = rank_top_k(similarities, top_k)
+        indexes = order if rows is None else rows[order]
+
+        return indexes, similarities[order]
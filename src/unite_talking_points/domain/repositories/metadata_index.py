@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.unite_talking_points.domain.entities.entities import Document
+
+DATE_FIELDS = ('date_created', 'date_modified')
+
+
+def to_datetime64(value) -> Optional[np.datetime64]:
+    """
+    Convert a document date into a numpy datetime, timezone aware dates are converted to UTC.
+    :param value: The date as a datetime or an ISO formatted string.
+    :return: date: Optional[np.datetime64] The date or None if it cannot be converted.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+    if not isinstance(value, datetime):
+        return None
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return np.datetime64(value, 's')
+
+
+def normalize_author(author: str) -> str:
+    return ' '.join(author.split()).casefold()
+
+
+class MetadataIndex:
+    """
+    An index over the metadata of the documents used to restrict the queries before scoring them.
+
+    Every date field is stored as a sorted array of dates together with the rows of the documents in that order, so
+    a date range is found with a binary search. Every author is stored as the sorted rows of its documents, so the
+    index grows with the number of documents and not with the number of authors times the number of documents.
+    """
+
+    def __init__(self):
+        self.n_documents = 0
+        self.author_rows: Dict[str, np.ndarray] = {}
+        self.sorted_dates: Dict[str, np.ndarray] = {}
+        self.sorted_rows: Dict[str, np.ndarray] = {}
+
+    def build(self, documents: Sequence[Document]):
+        """
+        Build the index from the documents of a repository, reading every document once.
+        :param documents: Sequence[Document] The documents, their position is the row used by the repository.
+        :return:
+        """
+        self.n_documents = len(documents)
+
+        author_rows: Dict[str, List[int]] = {}
+        date_rows = {field: ([], []) for field in DATE_FIELDS}
+        for row, document in enumerate(documents):
+            if document.author:
+                author_rows.setdefault(normalize_author(document.author), []).append(row)
+
+            for field in DATE_FIELDS:
+                date = to_datetime64(getattr(document, field))
+                if date is not None:
+                    date_rows[field][0].append(row)
+                    date_rows[field][1].append(date)
+
+        # Author rows, the documents are read in row order so the rows are already sorted
+        self.author_rows = {author: np.array(rows, dtype=np.int64) for author, rows in author_rows.items()}
+
+        # Sorted date arrays
+        for field, (rows, dates) in date_rows.items():
+            dates = np.array(dates, dtype='datetime64[s]')
+            order = np.argsort(dates, kind='stable')
+            self.sorted_dates[field] = dates[order]
+            self.sorted_rows[field] = np.array(rows, dtype=np.int64)[order]
+
+    def _author_rows(self, authors: Union[str, List[str]]) -> np.ndarray:
+        if isinstance(authors, str):
+            authors = [authors]
+
+        rows = np.zeros(0, dtype=np.int64)
+        for author in authors:
+            author_rows = self.author_rows.get(normalize_author(author))
+            if author_rows is not None:
+                rows = np.union1d(rows, author_rows)
+
+        return rows
+
+    def _date_rows(self, field: str, date_range: Tuple[Optional[datetime], Optional[datetime]]) -> np.ndarray:
+        start, end = date_range
+        sorted_dates = self.sorted_dates[field]
+
+        # Inclusive range, an open end keeps all the documents with a date
+        low = 0 if start is None else np.searchsorted(sorted_dates, to_datetime64(start), side='left')
+        high = len(sorted_dates) if end is None else np.searchsorted(sorted_dates, to_datetime64(end), side='right')
+
+        return np.sort(self.sorted_rows[field][low:high])
+
+    def filter(self, authors: Union[str, List[str]] = None,
+               date_created: Tuple[Optional[datetime], Optional[datetime]] = None,
+               date_modified: Tuple[Optional[datetime], Optional[datetime]] = None) -> Optional[np.ndarray]:
+        """
+        Get the rows of the documents that match all the given filters.
+        :param authors: Union[str, List[str]] The documents of any of these authors are kept.
+        :param date_created: Tuple[Optional[datetime], Optional[datetime]] Inclusive range of creation dates, any end
+        can be None to leave it open.
+        :param date_modified: Tuple[Optional[datetime], Optional[datetime]] Inclusive range of modification dates, any
+        end can be None to leave it open.
+        :return: rows: Optional[np.ndarray] The sorted rows of the matching documents or None if there are no filters.
+        """
+        filtered_rows = []
+        if authors is not None:
+            filtered_rows.append(self._author_rows(authors))
+        if date_created is not None:
+            filtered_rows.append(self._date_rows('date_created', date_created))
+        if date_modified is not None:
+            filtered_rows.append(self._date_rows('date_modified', date_modified))
+
+        if not filtered_rows:
+            return None
+
+        rows = filtered_rows[0]
+        for other_rows in filtered_rows[1:]:
+            rows = np.intersect1d(rows, other_rows, assume_unique=True)
+
+        return rows
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+def _freeze(value) -> Hashable:
+    # Lists of authors and date ranges become tuples so they can be part of a key
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+class QueryResultCache:
+    """
+    An LRU cache of the search results of a repository.
+
+    Every entry is stored with the version of the repository it was computed with. When the repository is set up,
+    loaded or updated its version changes, so the entries of the previous version are never returned and the cache is
+    emptied on the next access.
+    """
+
+    def __init__(self, max_size: int = 256):
+        """
+        :param max_size: int Maximum number of results kept, the cache is disabled when 0.
+        """
+        self.max_size = max_size
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def key(query: str, top_k: int = None, filters: Dict[str, Any] = None) -> Hashable:
+        """
+        Build the key of a query and its options.
+        :param query: str The normalized query.
+        :param top_k: int Number of results of the query.
+        :param filters: Dict[str, Any] Metadata filters of the query.
+        :return: key The key of the cache.
+        """
+        return query, top_k, _freeze(filters or {})
+
+    def _check_version(self, version: int) -> None:
+        if version != self.version:
+            self._results.clear()
+            self.version = version
+
+    def get(self, key: Hashable, version: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Get the result of a query and count the hit or miss.
+        :param key: The key of the query.
+        :param version: int The current version of the repository.
+        :return: result: Optional[Tuple[np.ndarray, np.ndarray]] The indexes and similarities or None on a miss.
+        """
+        self._check_version(version)
+
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self._results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: Hashable, version: int, result: Tuple[np.ndarray, np.ndarray]) -> None:
+        """
+        Store the result of a query, evicting the least recently used one when the cache is full.
+        :param key: The key of the query.
+        :param version: int The version of the repository the result was computed with.
+        :param result: Tuple[np.ndarray, np.ndarray] The indexes and similarities.
+        :return:
+        """
+        self._check_version(version)
+        if self.max_size <= 0:
+            return
+
+        # The arrays are shared by every hit, so they are made read-only
+        for array in result:
+            array.setflags(write=False)
+
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        self._results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the metrics of the cache.
+        :return: stats: Dict[str, Any] The hits, misses, hit rate, size and maximum size.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._results),
+            'max_size': self.max_size,
+        }
+
+    def __len__(self):
+        return len(self._results)
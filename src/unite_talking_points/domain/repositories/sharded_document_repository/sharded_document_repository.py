@@ -0,0 +1,272 @@
+import os
+import pickle
+import re
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, List, Set, Tuple
+
+import numpy as np
+import scipy as sp
+
+from src.unite_talking_points.domain.repositories.document_repository import AbstractDocumentRepository
+from src.unite_talking_points.domain.repositories.file_document_repository.file_document_repository import \
+    FileDocumentRepository
+from src.unite_talking_points.domain.repositories.metadata_index import MetadataIndex
+from src.unite_talking_points.utils.directory.directory_utils import get_file_paths
+from src.unite_talking_points.utils.infrastructure.ingestion import load_documents_from_paths
+from src.unite_talking_points.utils.infrastructure.sparse_storage import save_csr_matrix, load_csr_matrix
+from src.unite_talking_points.utils.nlp.analyzer import LemmaAnalyzer
+from src.unite_talking_points.utils.nlp.ranking import merge_top_k
+from src.unite_talking_points.utils.nlp.vectorization import count_document_frequencies, build_tfidf_vectorizer
+
+
+def _setup_shard(shard_path: str, file_paths: List[str],
+                 tfidf_args: Dict[str, Any]) -> Tuple[Counter, int, Dict[str, Counter], Set[str]]:
+    """
+    Load and lemmatize the documents of a shard. The documents and the lemmatized texts are saved in the shard folder.
+    :param shard_path: str The shard folder.
+    :param file_paths: List[str] The paths of the documents of the shard.
+    :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization
+    :return: document_frequencies: Counter The number of documents of the shard where each term appears.
+             n_documents: int The number of documents of the shard.
+             lemma_counts: Dict[str, Counter] The lemma counts of every surface form.
+             stop_words: Set[str] The stop words.
+    """
+    shard = FileDocumentRepository(shard_path)
+    os.makedirs(shard_path, exist_ok=True)
+
+    # Load and save the documents, the metadata index is shared by all the shards
+    shard.documents = load_documents_from_paths(file_paths)
+    with open(shard.documents_path, "wb") as file:
+        pickle.dump(shard.documents, file)
+
+    # Lemmatize the documents and keep them for the vectorization
+    lemmatized_texts, lemma_counts, stop_words = LemmaAnalyzer().lemmatize_documents(
+        document.content for document in shard.documents
+    )
+    with open(os.path.join(shard_path, 'lemmatized.pkl'), "wb") as file:
+        pickle.dump(lemmatized_texts, file)
+
+    document_frequencies, n_documents = count_document_frequencies(lemmatized_texts, tfidf_args)
+
+    return document_frequencies, n_documents, lemma_counts, stop_words
+
+
+def _vectorize_shard(shard_path: str, vectorizer) -> None:
+    """
+    Vectorize the lemmatized texts of a shard with the shared vectorizer and save the tfidf vectors. A shard whose
+    files were all unsupported or empty gets a matrix without rows.
+    :param shard_path: str The shard folder.
+    :param vectorizer: The shared fitted vectorizer.
+    :return:
+    """
+    lemmatized_path = os.path.join(shard_path, 'lemmatized.pkl')
+    with open(lemmatized_path, "rb") as file:
+        lemmatized_texts = pickle.load(file)
+
+    if lemmatized_texts:
+        vectors = vectorizer.transform(lemmatized_texts)
+    else:
+        vectors = sp.sparse.csr_matrix((0, len(vectorizer.vocabulary_)), dtype=np.float64)
+
+    save_csr_matrix(FileDocumentRepository(shard_path).vectors_path, vectors)
+    os.remove(lemmatized_path)
+
+
+class ShardedDocumentRepository(AbstractDocumentRepository):
+    def __init__(self, data_path: str, n_shards: int = 4, n_jobs: int = None, mmap: bool = True,
+                 query_cache_size: int = 256):
+        """
+        :param data_path: The folder where the documents are stored it needs the following structure:
+        <data_path>/
+            <data_path>/raw/
+                <data_path>/raw/doc1.pdf
+                <data_path>/raw/doc2.word
+                <data_path>/raw/...
+        Then, the raw documents are split in shards stored as <data_path>/shards/shard_<i>/, each one with its own
+        documents.pkl and vectors/. The metadata.pkl, vectorizer.pkl and analyzer.pkl are shared by all the shards.
+        :param n_shards: int Number of shards the raw documents are split into.
+        :param n_jobs: int Number of processes used to build the shards, the number of CPUs when None.
+        :param mmap: bool Whether to memory-map the tfidf matrix of the shards when loading them.
+        :param query_cache_size: int Maximum number of query results kept in the query cache, disabled when 0.
+        """
+        super().__init__(query_cache_size)
+
+        # Define data paths
+        self.data_path = data_path
+        self.raw_documents_path = os.path.join(self.data_path, 'raw')
+        self.shards_path = os.path.join(self.data_path, 'shards')
+        self.vectorizer_path = os.path.join(self.data_path, 'vectorizer.pkl')
+        self.analyzer_path = os.path.join(self.data_path, 'analyzer.pkl')
+        self.metadata_path = os.path.join(self.data_path, 'metadata.pkl')
+        self.n_shards = n_shards
+        self.n_jobs = n_jobs
+        self.mmap = mmap
+
+        # Define the shards, the offset of each shard in the documents and the shared vectorizer
+        self.shards: List[FileDocumentRepository] = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.metadata_index = MetadataIndex()
+        self.vectorizer = None
+        self.analyzer = None
+
+    def _shard_path(self, shard_index: int) -> str:
+        return os.path.join(self.shards_path, f'shard_{shard_index}')
+
+    def _shard_paths(self) -> List[str]:
+        """
+        Get the folders of the saved shards in shard order
+        :return: List[str] The shard folders.
+        """
+        shard_names = [name for name in os.listdir(self.shards_path) if re.fullmatch(r'shard_\d+', name)]
+        shard_names.sort(key=lambda name: int(name.split('_')[1]))
+
+        return [os.path.join(self.shards_path, name) for name in shard_names]
+
+    # Set up functions
+    def setup(self, tfidf_args: Dict[str, Any] = None):
+        """
+        Split the raw documents into shards and build them in parallel processes.
+
+        The shards share one vocabulary: the document frequencies of every shard are merged to fit a single
+        vectorizer, so the vectors are the same as the ones of a FileDocumentRepository on the same documents.
+        :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization
+        :return:
+        """
+        # Split the raw documents in contiguous shards to keep the order of the documents
+        file_paths = get_file_paths(self.raw_documents_path)
+        n_shards = max(1, min(self.n_shards, len(file_paths)))
+        shards_file_paths = [list(paths) for paths in np.array_split(np.array(file_paths, dtype=object), n_shards)]
+        shard_paths = [self._shard_path(shard_index) for shard_index in range(n_shards)]
+
+        # Remove the shards of a previous set up
+        if os.path.isdir(self.shards_path):
+            shutil.rmtree(self.shards_path)
+
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+            # Load and lemmatize the documents of every shard
+            results = list(executor.map(_setup_shard, shard_paths, shards_file_paths,
+                                        [tfidf_args] * n_shards))
+
+            # Merge the document frequencies and the lemmas in shard order
+            document_frequencies = Counter()
+            lemma_counts: Dict[str, Counter] = {}
+            stop_words = set()
+            n_documents = 0
+            for shard_frequencies, shard_n_documents, shard_lemma_counts, shard_stop_words in results:
+                document_frequencies.update(shard_frequencies)
+                n_documents += shard_n_documents
+                for text, counts in shard_lemma_counts.items():
+                    lemma_counts.setdefault(text, Counter()).update(counts)
+                stop_words.update(shard_stop_words)
+
+            self.vectorizer = build_tfidf_vectorizer(document_frequencies, n_documents, tfidf_args)
+            self.analyzer = LemmaAnalyzer()
+            self.analyzer.build_table(lemma_counts, stop_words)
+            self.analyzer.bind(self.vectorizer)
+
+            # Vectorize every shard with the shared vectorizer
+            list(executor.map(_vectorize_shard, shard_paths, [self.vectorizer] * n_shards))
+
+        self.load_shards()
+
+        # Index the metadata of all the documents
+        self.metadata_index.build(self.documents)
+        self._update_version()
+
+    # Save functions
+    def save(self):
+        """
+        Save the shared metadata index, vectorizer and analyzer, the shards are saved while they are set up
+        :return:
+        """
+        # Save the metadata index
+        with open(self.metadata_path, "wb") as file:
+            pickle.dump(self.metadata_index, file)
+
+        # Save the vectorizer
+        with open(self.vectorizer_path, "wb") as file:
+            pickle.dump(self.vectorizer, file)
+
+        # Save the analyzer
+        with open(self.analyzer_path, "wb") as file:
+            pickle.dump(self.analyzer, file)
+
+    # Load functions
+    def load_shards(self):
+        """
+        Load the documents and vectors of every shard
+        :return:
+        """
+        self.shards = []
+        for shard_path in self._shard_paths():
+            # The query results are cached by the sharded repository, not by its shards
+            shard = FileDocumentRepository(shard_path, mmap=self.mmap, query_cache_size=0)
+
+            # The shards have no metadata index of their own, the documents are read as _setup_shard saves them
+            with open(shard.documents_path, "rb") as file:
+                shard.documents = pickle.load(file)
+            shard.vectors = load_csr_matrix(shard.vectors_path, mmap=self.mmap)
+            shard.vectorizer = self.vectorizer
+            shard.analyzer = self.analyzer
+            self.shards.append(shard)
+
+        # The documents of the shards are exposed as a single list
+        self.documents = [document for shard in self.shards for document in shard.documents]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+        self._update_version()
+
+    def load(self):
+        """
+        Load the shared metadata index, vectorizer and analyzer and the shards
+        :return:
+        """
+        # Load the metadata index
+        with open(self.metadata_path, "rb") as file:
+            self.metadata_index = pickle.load(file)
+
+        # Load the vectorizer
+        with open(self.vectorizer_path, "rb") as file:
+            self.vectorizer = pickle.load(file)
+
+        # Load the analyzer
+        with open(self.analyzer_path, "rb") as file:
+            self.analyzer = pickle.load(file)
+        self.analyzer.bind(self.vectorizer)
+
+        # Load the shards
+        self.load_shards()
+
+    # Search functions
+    def search(self, query_vector, top_k: int = None, rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score the shards concurrently and merge their top k, ties are ranked by index as in FileDocumentRepository
+        :param query_vector: Sparse matrix with a single row.
+        :param top_k: int Number of documents to return, all of them when None.
+        :param rows: np.ndarray The sorted rows of the candidate documents, all of them when None.
+        :return: indexes: np.ndarray The indexes of the most similar documents in descending order of similarity.
+                 similarities: np.ndarray The similarities of the documents.
+        """
+        # Split the candidate rows between the shards
+        shards_rows = [None] * len(self.shards)
+        if rows is not None:
+            bounds = np.searchsorted(rows, self.offsets)
+            shards_rows = [rows[start:end] - offset for start, end, offset in zip(bounds, bounds[1:], self.offsets)]
+
+        def search_shard(shard_index: int):
+            shard_rows = shards_rows[shard_index]
+            if len(self.shards[shard_index]) == 0 or (shard_rows is not None and len(shard_rows) == 0):
+                return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+            shard_indexes, shard_similarities = self.shards[shard_index].search(query_vector, top_k, shard_rows)
+            return shard_indexes + self.offsets[shard_index], shard_similarities
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.shards))) as executor:
+            results = list(executor.map(search_shard, range(len(self.shards))))
+
+        # The shard indexes are already moved to the document indexes
+        indexes = np.concatenate([np.zeros(0, dtype=np.int64)] + [shard_indexes for shard_indexes, _ in results])
+        similarities = np.concatenate([np.zeros(0)] + [shard_similarities for _, shard_similarities in results])
+
+        return merge_top_k(indexes, similarities, top_k)
@@ -3,6 +3,7 @@ from typing import List
 from langchain import OpenAI, PromptTemplate, LLMChain
 
 from src.unite_talking_points.domain.services.service import Service
+from src.unite_talking_points.utils.infrastructure.llm_usage import LLMUsage, LLMUsageCallback, HTTPRequestCounter
 
 
 class GenerationService(Service):
@@ -10,12 +11,14 @@ class GenerationService(Service):
     A service that generates talking points based on other documents using LangChain and OpenAI models.
     """
 
-    def __init__(self, summaries: List[str], generation_parameters: dict, openai_api_key: str):
+    def __init__(self, summaries: List[str], generation_parameters: dict, openai_api_key: str,
+                 request_id: str = None):
         """
         A service that generates talking points based on other documents using LangChain and OpenAI models.
         :param summaries: List[str] List summarized texts
         :param generation_parameters: dict The parameters for the generation.
         :param openai_api_key: str The OpenAI API key.
+        :param request_id: str The request the LLM calls are recorded with, a random one when None.
         """
         super().__init__()
         self.generation_parameters = generation_parameters
@@ -23,6 +26,11 @@ class GenerationService(Service):
 
         self.openai_api_key = openai_api_key
 
+        # Tokens, latency, retries and cache hits of the LLM calls
+        self.usage = LLMUsage(request_id)
+        self._request_counter = HTTPRequestCounter()
+        self._usage_callback = None
+
     def _pre_process(self):
         """
         Initialize the Langchain prompt with the given parameters.
@@ -30,7 +38,10 @@ class GenerationService(Service):
         This includes initializing the model connection and defining the Prompt Template.
         """
         # Initialize the model connection
-        self.llm = OpenAI(temperature=self.generation_parameters['temperature'], openai_api_key=self.openai_api_key)
+        self.llm = OpenAI(temperature=self.generation_parameters['temperature'], openai_api_key=self.openai_api_key,
+                          http_client=self._request_counter.http_client())
+        self._usage_callback = LLMUsageCallback(self.usage, 'generation', self.llm.model_name,
+                                                self._request_counter, self.llm.batch_size)
 
         # TODO: Define the prompt template and chain as a singleton
         generation_template = """
@@ -50,7 +61,7 @@ class GenerationService(Service):
         self.chain = LLMChain(llm=self.llm, prompt=self.generation_prompt_template)
 
     def _process(self):
-        self.output = self.chain.run(**self.generation_parameters)
+        self.output = self.chain.run(callbacks=[self._usage_callback], **self.generation_parameters)
 
     def _post_process(self):
         return self.output
@@ -1,43 +1,92 @@
-from typing import Union
-
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Any, Dict, Union
 
 from src.unite_talking_points.domain.repositories.file_document_repository.file_document_repository import \
     FileDocumentRepository
+from src.unite_talking_points.domain.repositories.sharded_document_repository.sharded_document_repository import \
+    ShardedDocumentRepository
 from src.unite_talking_points.domain.services.service import Service
 
 
 class QueryService(Service):
     """
     A service for querying the documents. It returns the indexes of the documents with the highest similarity.
+
+    The results are kept in the query cache of the repository, so a query repeated with the same options on the same
+    version of the repository is neither vectorized nor scored again.
     """
 
-    def __init__(self, query: str, repository: Union[FileDocumentRepository]):
+    def __init__(self, query: str, repository: Union[FileDocumentRepository, ShardedDocumentRepository],
+                 top_k: int = None, filters: Dict[str, Any] = None):
+        """
+        :param query: str The query.
+        :param repository: Union[FileDocumentRepository, ShardedDocumentRepository] The repository to query.
+        :param top_k: int Number of indexes to return, all of them when None.
+        :param filters: Dict[str, Any] Metadata filters restricting the documents to score, see MetadataIndex.filter
+        for the accepted keys (authors, date_created and date_modified).
+        """
         super().__init__()
         self.query = query
         self._query_vector = None
         self.repository = repository
+        self.top_k = top_k
+        self.filters = filters
+        self._candidate_rows = None
         self.sorted_indexes = None
+        self.similarities = None
+        self.cache_hit = False
+        self._cache_key = None
+
+    def _normalize_query(self) -> str:
+        """
+        Normalize the query the same way the analyzer does, so queries with the same vector share a cache entry.
+        :return: query: str The normalized query.
+        """
+        query = self.query
+        if self.repository.analyzer is not None:
+            query = self.repository.analyzer.clean(query)
+
+        return ' '.join(query.split())
 
     def _pre_process(self):
         """
         Pre-process the query.
 
-        This includes vectorizing the query.
+        This includes looking the query up in the query cache of the repository and, on a miss, lemmatizing and
+        vectorizing the query with the analyzer shared with the documents and finding the documents that match the
+        metadata filters.
         """
+        # Cached result of the query
+        self._cache_key = self.repository.query_cache.key(self._normalize_query(), self.top_k, self.filters)
+        cached_result = self.repository.query_cache.get(self._cache_key, self.repository.version)
+        if cached_result is not None:
+            self.sorted_indexes, self.similarities = cached_result
+            self.cache_hit = True
+            return
+
         # Vectorization of the query
-        self._query_vector = self.repository.vectorizer.transform([self.query])
+        if self.repository.analyzer is not None:
+            self._query_vector = self.repository.analyzer.transform(self.query)
+        else:
+            self._query_vector = self.repository.vectorizer.transform([self.query])
+
+        # Candidate documents of the metadata filters
+        if self.filters:
+            self._candidate_rows = self.repository.metadata_index.filter(**self.filters)
 
     def _process(self):
         """
         Process the query.
 
-        This includes calculating the cosine similarity between the query vector and all the document vectors.
+        This includes calculating the cosine similarity between the query vector and the candidate document vectors.
         The indexes of the documents with the highest similarities are sorted in descending order and stored.
         """
-        # Calculate cosine similarity
-        similarities = cosine_similarity(self.repository.vectors, self._query_vector)
-        self.sorted_indexes = similarities.flatten().argsort()[::-1]
+        if self.cache_hit:
+            return
+
+        self.sorted_indexes, self.similarities = self.repository.search(self._query_vector, self.top_k,
+                                                                        self._candidate_rows)
+        self.repository.query_cache.put(self._cache_key, self.repository.version,
+                                        (self.sorted_indexes, self.similarities))
 
     def _post_process(self):
         """
@@ -46,4 +95,4 @@ class QueryService(Service):
         This includes returning the sorted indexes.
         """
         # Return the sorted indexes
-        return list(self.sorted_indexes)
+        return self.sorted_indexes.tolist()
@@ -1,9 +1,40 @@
+from typing import Any, Dict, List
+
+import openai
 from langchain import OpenAI
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.chains.summarize import load_summarize_chain
+from langchain.docstore.document import Document as LangchainDocument
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from src.unite_talking_points.domain.entities.entities import Document
 from src.unite_talking_points.domain.services.service import Service
+from src.unite_talking_points.utils.infrastructure.completions import complete_prompts
+from src.unite_talking_points.utils.infrastructure.llm_usage import LLMUsage, LLMUsageCallback, HTTPRequestCounter
+from src.unite_talking_points.utils.nlp.extractive import TextRankSummarizer
+
+# Summarization strategies
+MAP_REDUCE = 'map_reduce'
+ADAPTIVE = 'adaptive'
+EXTRACTIVE = 'extractive'
+
+# Summarization paths chosen by the adaptive strategy
+AS_IS_PATH = 'as_is'
+STUFF_PATH = 'stuff'
+MAP_REDUCE_PATH = 'map_reduce'
+EXTRACTIVE_PATH = 'extractive'
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """
+    A LangChain callback handler that counts the prompts sent to the model.
+    """
+
+    def __init__(self):
+        self.llm_calls = 0
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.llm_calls += len(prompts)
 
 
 class SummaryService(Service):
@@ -11,44 +42,164 @@ class SummaryService(Service):
     A service that summaries text documents using LangChain and OpenAI models.
     """
 
-    def __init__(self, document: Document, openai_api_key: str):
+    def __init__(self, document: Document, openai_api_key: str, batch_size: int = None,
+                 openai_api_base: str = None, strategy: str = MAP_REDUCE, short_document_tokens: int = None,
+                 summarizer: TextRankSummarizer = None, condense_sentences: int = None, request_id: str = None):
         """
         A service that summarizes text documents using LangChain and OpenAI models.
         :param document: Document The Document to be summarized.
         :param openai_api_key: str The OpenAI API key.
+        :param batch_size: int Number of chunk prompts sent in every completion request of the map step. When None,
+        the map step is left to the LangChain map_reduce chain.
+        :param openai_api_base: str Base URL of the OpenAI API, the default one when None.
+        :param strategy: str 'map_reduce' always summarizes with the map_reduce chain. 'adaptive' chooses the path by
+        the token count of the document: short documents are returned as they are, documents that fit the context
+        window are summarized with a single 'stuff' call and only larger documents use the map_reduce chain.
+        'extractive' returns the most central sentences of the document found by the summarizer, without calling the
+        model.
+        :param short_document_tokens: int Maximum number of tokens of the documents returned as they are by the
+        adaptive strategy, the maximum number of tokens of a summary when None.
+        :param summarizer: TextRankSummarizer The local summarizer of the extractive strategy and of the condensing.
+        :param condense_sentences: int When given, the model strategies summarize the best condense_sentences
+        sentences of the document found by the summarizer instead of the whole document.
+        :param request_id: str The request the LLM calls are recorded with, a random one when None.
         """
         super().__init__()
+        if strategy not in (MAP_REDUCE, ADAPTIVE, EXTRACTIVE):
+            raise ValueError(f"Unknown summarization strategy: {strategy}")
+        if summarizer is None and (strategy == EXTRACTIVE or condense_sentences):
+            raise ValueError("The extractive strategy and the condensing need a summarizer")
+
         self.document = document
         self.openai_api_key = openai_api_key
+        self.batch_size = batch_size
+        self.openai_api_base = openai_api_base
+        self.strategy = strategy
+        self.short_document_tokens = short_document_tokens
+        self.summarizer = summarizer
+        self.condense_sentences = condense_sentences
+        self.content = None
         self.summary = None
         self.chunks = None
         self.chain = None
+        self.llm = None
+        self.map_requests = 0
         self.summary = ''
 
+        # Record of the summarization of the document
+        self.path = None
+        self.document_tokens = None
+        self.llm_calls = 0
+        self._call_counter = LLMCallCounter()
+
+        # Tokens, latency, retries and cache hits of the LLM calls
+        self.usage = LLMUsage(request_id)
+        self._request_counter = HTTPRequestCounter()
+        self._usage_callback = None
+
+    def _choose_path(self) -> str:
+        """
+        Chooses the summarization path of the adaptive strategy by the token count of the document.
+        :return: path: str The summarization path.
+        """
+        self.document_tokens = self.llm.get_num_tokens(self.content)
+
+        short_document_tokens = self.short_document_tokens
+        if short_document_tokens is None:
+            short_document_tokens = self.llm.max_tokens
+        if self.document_tokens <= short_document_tokens:
+            return AS_IS_PATH
+
+        # The whole prompt and the summary have to fit in the context window
+        stuff_chain = load_summarize_chain(llm=self.llm, chain_type='stuff')
+        stuff_prompt = stuff_chain.llm_chain.prompt.format(
+            **{stuff_chain.document_variable_name: self.content}
+        )
+        context_size = self.llm.modelname_to_contextsize(self.llm.model_name)
+        if self.llm.get_num_tokens(stuff_prompt) + self.llm.max_tokens <= context_size:
+            return STUFF_PATH
+
+        return MAP_REDUCE_PATH
+
     def _pre_process(self):
         """
         Pre-processes the document.
 
-        This includes initializing the model connection, splitting the document into chunks,
-        and loading the summarization chain.
+        This includes condensing the document, initializing the model connection, choosing the summarization path,
+        splitting the document into chunks, and loading the summarization chain. The extractive strategy does not
+        need the model.
         """
+        if self.strategy == EXTRACTIVE:
+            self.path = EXTRACTIVE_PATH
+            return
+
+        # Condense the document with the local summarizer
+        self.content = self.document.content
+        if self.condense_sentences:
+            self.content = self.summarizer.summarize(self.content, self.condense_sentences)
+
         # Initialize the model connection
-        llm = OpenAI(temperature=0., openai_api_key=self.openai_api_key)
+        self.llm = OpenAI(temperature=0., openai_api_key=self.openai_api_key, openai_api_base=self.openai_api_base,
+                          http_client=self._request_counter.http_client())
+        self._usage_callback = LLMUsageCallback(self.usage, 'summary', self.llm.model_name, self._request_counter,
+                                                self.llm.batch_size)
+
+        # Choose the summarization path
+        self.path = self._choose_path() if self.strategy == ADAPTIVE else MAP_REDUCE_PATH
+
+        if self.path == STUFF_PATH:
+            self.chunks = [LangchainDocument(page_content=self.content)]
+            self.chain = load_summarize_chain(llm=self.llm, chain_type='stuff', verbose=True)
 
-        # Split the document into chunks
-        text_splitter = RecursiveCharacterTextSplitter(separators=["\n\n", "\n"], chunk_size=10000, chunk_overlap=500)
-        self.chunks = text_splitter.create_documents([self.document.content])
+        elif self.path == MAP_REDUCE_PATH:
+            # Split the document into chunks
+            text_splitter = RecursiveCharacterTextSplitter(separators=["\n\n", "\n"], chunk_size=10000,
+                                                           chunk_overlap=500)
+            self.chunks = text_splitter.create_documents([self.content])
 
-        # Load the summary chain
-        self.chain = load_summarize_chain(llm=llm, chain_type='map_reduce', verbose=True)
+            # Load the summary chain
+            self.chain = load_summarize_chain(llm=self.llm, chain_type='map_reduce', verbose=True)
+
+    def _map_batched(self):
+        """
+        Runs the map step of the summarization chain sending several chunk prompts in every completion request.
+        :return: summaries: List[LangchainDocument] The summary of every chunk in chunk order.
+        """
+        map_prompt = self.chain.llm_chain.prompt
+        prompts = [map_prompt.format(**{self.chain.document_variable_name: chunk.page_content})
+                   for chunk in self.chunks]
+
+        client = openai.OpenAI(api_key=self.openai_api_key, base_url=self.openai_api_base)
+        completions, self.map_requests = complete_prompts(
+            client, prompts, self.batch_size,
+            model=self.llm.model_name, usage=self.usage, service='summary',
+            temperature=self.llm.temperature, max_tokens=self.llm.max_tokens
+        )
+        self._call_counter.llm_calls += len(prompts)
+
+        return [LangchainDocument(page_content=completion) for completion in completions]
 
     def _process(self):
         """
         Processes the document.
 
-        This includes running the summarization chain on the chunks.
+        This includes running the summarization chain on the chunks. In batching mode, the map step is run with
+        multi-prompt completion requests and the chunk summaries are combined with the reduce step of the chain.
+        Short documents of the adaptive strategy are not summarized and the extractive strategy runs locally.
         """
-        self.summary = self.chain.run(self.chunks)
+        callbacks = [self._call_counter, self._usage_callback]
+
+        if self.path == EXTRACTIVE_PATH:
+            self.summary = self.summarizer.summarize(self.document.content)
+        elif self.path == AS_IS_PATH:
+            self.summary = self.content
+        elif self.path == MAP_REDUCE_PATH and self.batch_size:
+            chunk_summaries = self._map_batched()
+            self.summary = self.chain.reduce_documents_chain.run(chunk_summaries, callbacks=callbacks)
+        else:
+            self.summary = self.chain.run(self.chunks, callbacks=callbacks)
+
+        self.llm_calls = self._call_counter.llm_calls
 
     def _post_process(self):
         """
@@ -1,4 +1,6 @@
 import os
+from datetime import datetime
+from typing import Any, Dict
 
 
 def print_word_art():
@@ -31,3 +33,43 @@ def print_document_query_results(query_results, query_indexes):
             print(document.content)
 
         print("-" * 100)
+
+
+def print_setup_progress(n_extracted: int, n_lemmatized: int, n_files: int):
+    print(f"\rExtracted {n_extracted}/{n_files} files, lemmatized {n_lemmatized} documents", end="", flush=True)
+
+
+def print_llm_usage(request_usage, session_usage):
+    print(f"LLM usage of the request: {request_usage.summary()}")
+    print(f"LLM usage of the session: {session_usage.summary()}")
+
+
+def parse_query_filters(authors: str, created_from: str, created_to: str) -> Dict[str, Any]:
+    """
+    Parse the metadata filters introduced in the console, empty inputs are not used as filters.
+    :param authors: str Authors separated by commas.
+    :param created_from: str First creation date in ISO format (YYYY-MM-DD).
+    :param created_to: str Last creation date in ISO format (YYYY-MM-DD).
+    :return: filters: Dict[str, Any] The filters for the QueryService.
+    """
+    filters = {}
+
+    authors = [author.strip() for author in authors.split(",") if author.strip()]
+    if authors:
+        filters['authors'] = authors
+
+    created_from = created_from.strip()
+    created_to = created_to.strip()
+    created_from = datetime.fromisoformat(created_from) if created_from else None
+    if created_to:
+        # A date without time includes the whole day
+        date_only = len(created_to) == len("YYYY-MM-DD")
+        created_to = datetime.fromisoformat(created_to)
+        if date_only:
+            created_to = created_to.replace(hour=23, minute=59, second=59)
+    else:
+        created_to = None
+    if created_from is not None or created_to is not None:
+        filters['date_created'] = (created_from, created_to)
+
+    return filters
@@ -0,0 +1,195 @@
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import docx
+from docx.enum.text import WD_BREAK
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from src.unite_talking_points.utils.infrastructure.docx_extraction import extract_docx
+from src.unite_talking_points.utils.infrastructure.ingestion import load_word_document
+
+WORDS = ('assembly', 'resolution', 'delegation', 'climate', 'security', 'council', 'développement', 'durable',
+         'sustainable', 'peace', 'ñandú', 'agenda', '2030', 'human', 'rights', 'É', 'session', 'report')
+
+
+def _sentence(rng: random.Random, n_words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def _add_hyperlink(paragraph, text: str, url: str):
+    # python-docx has no API to add hyperlinks, the element is built by hand
+    relationship_id = paragraph.part.relate_to(
+        url, 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink', is_external=True
+    )
+    hyperlink = OxmlElement('w:hyperlink')
+    hyperlink.set(qn('r:id'), relationship_id)
+    run = OxmlElement('w:r')
+    text_element = OxmlElement('w:t')
+    text_element.text = text
+    run.append(text_element)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+
+def generate_docx_fixture(path: str, n_paragraphs: int, seed: int = 0) -> None:
+    """
+    Write a DOCX file with python-docx that has the elements the extractors have to handle: headings, runs with
+    tabs, line, page and column breaks, hyperlinks, tables, empty paragraphs, non-ASCII text and core properties.
+    :param path: str Path of the DOCX file.
+    :param n_paragraphs: int Number of paragraphs of the body.
+    :param seed: int Seed of the random content.
+    :return:
+    """
+    rng = random.Random(seed)
+    document = docx.Document()
+
+    for index in range(n_paragraphs):
+        kind = index % 10
+        if kind == 0:
+            document.add_heading(_sentence(rng, 4), level=1 + index % 3)
+        elif kind == 1:
+            paragraph = document.add_paragraph(_sentence(rng, 10))
+            run = paragraph.add_run(_sentence(rng, 3))
+            run.bold = True
+            run.add_tab()
+            run.add_text(_sentence(rng, 2))
+            run.add_break()
+            run.add_text(_sentence(rng, 5))
+        elif kind == 2:
+            paragraph = document.add_paragraph(_sentence(rng, 8))
+            paragraph.add_run().add_break(WD_BREAK.PAGE)
+            paragraph.add_run().add_break(WD_BREAK.COLUMN)
+            paragraph.add_run(_sentence(rng, 4))
+        elif kind == 3:
+            paragraph = document.add_paragraph(_sentence(rng, 6) + ' ')
+            _add_hyperlink(paragraph, _sentence(rng, 3), 'https://www.un.org')
+            paragraph.add_run(' ' + _sentence(rng, 4))
+        elif kind == 4:
+            table = document.add_table(rows=2, cols=3)
+            for cell in table._cells:
+                cell.text = _sentence(rng, 3)
+        elif kind == 5:
+            document.add_paragraph()
+        else:
+            document.add_paragraph(_sentence(rng, rng.randint(20, 80)), style='List Bullet' if kind == 6 else None)
+
+    document.core_properties.author = _sentence(rng, 2)
+    document.core_properties.created = datetime(2023, 9, 19, 10, 30, tzinfo=timezone.utc)
+    document.core_properties.modified = datetime(2023, 9, 20, 8, 15, tzinfo=timezone.utc)
+    document.save(path)
+
+
+def python_docx_extractor(path: str):
+    document = load_word_document(path)
+    return document.content, document.author, document.date_created, document.date_modified
+
+
+def streaming_extractor(path: str):
+    return extract_docx(path)
+
+
+EXTRACTORS: Dict[str, Callable[[str], Any]] = {
+    'python-docx': python_docx_extractor,
+    'streaming': streaming_extractor,
+}
+
+
+def compare_extractors(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Compare the content and core properties extracted by the streaming extractor with the ones of python-docx.
+    :param paths: List[str] Paths of the DOCX files.
+    :return: comparisons: List[Dict[str, Any]] Whether every field is equal for every file.
+    """
+    comparisons = []
+    for path in paths:
+        expected = python_docx_extractor(path)
+        extracted = streaming_extractor(path)
+        comparisons.append({
+            'path': path,
+            'content': expected[0] == extracted[0],
+            'author': expected[1] == extracted[1],
+            'date_created': expected[2] == extracted[2],
+            'date_modified': expected[3] == extracted[3],
+        })
+
+    return comparisons
+
+
+def _measure(extractor_name: str, path: str) -> Dict[str, float]:
+    # Runs in a new process, so the peak memory is the one of a single extraction
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    EXTRACTORS[extractor_name](path)
+    seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {'seconds': seconds, 'peak_memory_kb': rss_after - rss_before}
+
+
+def benchmark_extractors(paths: List[str], repeat: int = 3) -> List[Dict[str, Any]]:
+    """
+    Measure the extraction time and peak memory of every extractor on every file. Every extraction runs in a new
+    process, the best time of the repetitions is kept.
+    :param paths: List[str] Paths of the DOCX files.
+    :param repeat: int Number of repetitions.
+    :return: results: List[Dict[str, Any]] The size, time and peak memory of every file and extractor.
+    """
+    results = []
+    for path in paths:
+        for extractor_name in EXTRACTORS:
+            measures = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    measures.append(executor.submit(_measure, extractor_name, path).result())
+
+            results.append({
+                'path': path,
+                'file_bytes': os.path.getsize(path),
+                'extractor': extractor_name,
+                'seconds': min(measure['seconds'] for measure in measures),
+                'peak_memory_kb': min(measure['peak_memory_kb'] for measure in measures),
+            })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare and benchmark the DOCX extractors on generated fixtures.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help="Number of paragraphs of every fixture.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of every measure.")
+    parser.add_argument('--output', default=None, help="Folder of the fixtures, a temporary one when not given.")
+    args = parser.parse_args()
+
+    output = args.output or tempfile.mkdtemp()
+    os.makedirs(output, exist_ok=True)
+
+    # Generate the fixtures
+    paths = []
+    for seed, size in enumerate(args.sizes):
+        path = os.path.join(output, f'fixture_{size}.docx')
+        generate_docx_fixture(path, size, seed)
+        paths.append(path)
+
+    print("Correctness:")
+    for comparison in compare_extractors(paths):
+        fields = [field for field in ('content', 'author', 'date_created', 'date_modified') if not comparison[field]]
+        print(f"{os.path.basename(comparison['path'])}: {'OK' if not fields else 'DIFFERENT ' + ', '.join(fields)}")
+
+    print()
+    print("Benchmark:")
+    for result in benchmark_extractors(paths, args.repeat):
+        print(f"{os.path.basename(result['path'])} ({result['file_bytes'] / 1024:.0f} KB) {result['extractor']}: "
+              f"{result['seconds'] * 1000:.1f} ms, {result['peak_memory_kb'] / 1024:.1f} MB peak")
+
+
+if __name__ == '__main__':
+    main()
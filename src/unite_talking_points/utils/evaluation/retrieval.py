@@ -0,0 +1,216 @@
+import copy
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import scipy as sp
+
+from src.unite_talking_points.domain.entities.entities import Document
+from src.unite_talking_points.domain.repositories.file_document_repository.file_document_repository import \
+    FileDocumentRepository
+from src.unite_talking_points.domain.services.query_service.query_service import QueryService
+from src.unite_talking_points.utils.nlp.analyzer import LemmaAnalyzer
+from src.unite_talking_points.utils.nlp.vectorization import fit_tfidf
+
+
+def load_judgments(data_dir: str) -> List[Dict[str, Any]]:
+    """
+    Load the labelled JSON records of a directory. Every record has a label, document_name, meeting_name,
+    meeting_date (DD-MM-YYYY), content and prompt.
+    :param data_dir: str Path to the directory containing the JSON files.
+    :return: records: List[Dict[str, Any]] The records sorted by file name, with the file name added.
+    """
+    records = []
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.endswith('.json'):
+            with open(os.path.join(data_dir, filename), 'r') as file:
+                record = json.load(file)
+            record['file_name'] = filename
+            records.append(record)
+
+    return records
+
+
+def recall_at_k(gains: np.ndarray, n_relevant: np.ndarray) -> np.ndarray:
+    """
+    Recall of every query in its top k.
+    :param gains: np.ndarray (n_queries, k) The relevance grade of the retrieved documents.
+    :param n_relevant: np.ndarray (n_queries,) The number of relevant documents of every query.
+    :return: recalls: np.ndarray (n_queries,) nan for queries without relevant documents.
+    """
+    hits = (gains > 0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n_relevant > 0, hits / n_relevant, np.nan)
+
+
+def reciprocal_rank(gains: np.ndarray) -> np.ndarray:
+    """
+    Reciprocal rank of the first relevant document of every query, 0 when none is retrieved.
+    :param gains: np.ndarray (n_queries, k) The relevance grade of the retrieved documents.
+    :return: reciprocal_ranks: np.ndarray (n_queries,)
+    """
+    relevant = gains > 0
+    first = relevant.argmax(axis=1)
+
+    return np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+
+
+def ndcg_at_k(gains: np.ndarray, ideal_gains: np.ndarray) -> np.ndarray:
+    """
+    Normalized discounted cumulative gain of every query in its top k, with exponential gains.
+    :param gains: np.ndarray (n_queries, k) The relevance grade of the retrieved documents.
+    :param ideal_gains: np.ndarray (n_queries, k) The relevance grades of every query sorted in descending order.
+    :return: ndcgs: np.ndarray (n_queries,) nan for queries without relevant documents.
+    """
+    discounts = 1.0 / np.log2(np.arange(2, gains.shape[1] + 2))
+    dcg = ((2.0 ** gains - 1) * discounts).sum(axis=1)
+    idcg = ((2.0 ** ideal_gains - 1) * discounts).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(idcg > 0, dcg / idcg, np.nan)
+
+
+# Evaluator of the grid search worker processes
+_worker_evaluator = None
+
+
+def _init_worker(evaluator: 'RetrievalEvaluator'):
+    global _worker_evaluator
+    _worker_evaluator = evaluator
+
+
+def _evaluate_worker(tfidf_args: Dict[str, Any]) -> Dict[str, Any]:
+    return _worker_evaluator.evaluate(tfidf_args)
+
+
+class RetrievalEvaluator:
+    """
+    Offline evaluation of the retrieval with the labelled JSON records.
+
+    Every record is a document of the evaluation corpus and its prompt is a query. The document of the prompt has a
+    relevance grade of 2 and the other documents of the same meeting a grade of 1. Every TF-IDF configuration is
+    reported with its recall@k, MRR and nDCG@k, its index size, build time and per query latency through the
+    QueryService.
+    """
+
+    def __init__(self, data_dir: str, k: int = 10):
+        """
+        :param data_dir: str Path to the directory containing the labelled JSON files.
+        :param k: int Cut-off of the metrics.
+        """
+        self.data_dir = data_dir
+        self.k = k
+
+        records = load_judgments(data_dir)
+        self.queries = [record['prompt'] for record in records]
+        self.documents = [
+            Document(content=record['content'],
+                     _id=record['file_name'],
+                     origin=record['meeting_name'],
+                     title=record['document_name'],
+                     date_created=datetime.strptime(record['meeting_date'], '%d-%m-%Y'),
+                     source=os.path.join(data_dir, record['file_name']))
+            for record in records
+        ]
+
+        # Relevance grades (n_queries, n_documents)
+        meetings = np.array([record['meeting_name'] for record in records], dtype=object)
+        same_meeting = meetings[:, None] == meetings[None, :]
+        grades = same_meeting.astype(np.float64)
+        np.fill_diagonal(grades, 2.0)
+        self.judgments = sp.sparse.csr_matrix(grades)
+
+        # The lemmatization does not depend on the configuration, so it is done once
+        self.analyzer = LemmaAnalyzer()
+        start = time.perf_counter()
+        self.lemmatized_documents = self.analyzer.fit_lemmatize(document.content for document in self.documents)
+        self.lemmatization_seconds = time.perf_counter() - start
+
+    def build_repository(self, tfidf_args: Dict[str, Any] = None) -> FileDocumentRepository:
+        """
+        Build an in-memory repository of the evaluation corpus. Its query result and query vector caches are
+        disabled, so every query of the evaluation is lemmatized, vectorized and scored.
+        :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization
+        :return: repository: FileDocumentRepository The repository.
+        """
+        repository = FileDocumentRepository(self.data_dir, query_cache_size=0)
+        repository.documents = self.documents
+        repository.metadata_index.build(self.documents)
+        repository.vectors, repository.vectorizer = fit_tfidf(self.lemmatized_documents, tfidf_args)
+
+        # Each repository gets its own copy of the fitted analyzer, whose query vector cache is not shared and disabled
+        repository.analyzer = copy.deepcopy(self.analyzer)
+        repository.analyzer.cache_size = 0
+        repository.analyzer.bind(repository.vectorizer)
+
+        return repository
+
+    def evaluate(self, tfidf_args: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Evaluate a TF-IDF configuration.
+        :param tfidf_args: Dict[str, Any] The arguments for the scikit-learn tfidf vectorization
+        :return: report: Dict[str, Any] The metrics, index size, build time and latencies of the configuration.
+        """
+        report = {'tfidf_args': tfidf_args}
+
+        start = time.perf_counter()
+        try:
+            repository = self.build_repository(tfidf_args)
+        except ValueError as error:
+            report['error'] = str(error)
+            return report
+        report['build_seconds'] = time.perf_counter() - start + self.lemmatization_seconds
+
+        # Index size
+        vectors = repository.vectors
+        report['n_features'] = vectors.shape[1]
+        report['index_bytes'] = vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes
+
+        # Run the queries, padding with -1 when fewer than k documents are retrieved
+        k = min(self.k, len(self.documents))
+        retrieved = np.full((len(self.queries), k), -1, dtype=np.int64)
+        latencies = np.zeros(len(self.queries))
+        for query_index, query in enumerate(self.queries):
+            start = time.perf_counter()
+            indexes = QueryService(query, repository, k).run()
+            latencies[query_index] = time.perf_counter() - start
+            retrieved[query_index, :len(indexes)] = indexes
+
+        # Relevance of the retrieved documents and of the ideal ranking
+        rows = np.repeat(np.arange(len(self.queries)), k)
+        gains = np.asarray(self.judgments[rows, np.maximum(retrieved.ravel(), 0)]).reshape(retrieved.shape)
+        gains[retrieved < 0] = 0
+        ideal_gains = -np.sort(-self.judgments.toarray(), axis=1)[:, :k]
+        n_relevant = np.diff(self.judgments.indptr)
+
+        report[f'recall@{self.k}'] = float(np.nanmean(recall_at_k(gains, n_relevant)))
+        report['mrr'] = float(reciprocal_rank(gains).mean())
+        report[f'ndcg@{self.k}'] = float(np.nanmean(ndcg_at_k(gains, ideal_gains)))
+
+        # Latencies in milliseconds
+        report['latency_mean_ms'] = float(latencies.mean() * 1000)
+        report['latency_p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+        report['latency_p95_ms'] = float(np.percentile(latencies, 95) * 1000)
+
+        return report
+
+    def grid_search(self, param_grid: Dict[str, List[Any]], n_jobs: int = None) -> List[Dict[str, Any]]:
+        """
+        Evaluate every combination of TF-IDF arguments in parallel processes.
+        :param param_grid: Dict[str, List[Any]] The values to try for every TF-IDF argument, for example
+        {"ngram_range": [(1, 1), (1, 3)], "min_df": [1, 0.025], "max_df": [0.5, 1.0]}.
+        :param n_jobs: int Number of processes, the number of CPUs when None.
+        :return: reports: List[Dict[str, Any]] The report of every configuration in grid order.
+        """
+        names = list(param_grid)
+        configurations = [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(self,)) as executor:
+            reports = list(executor.map(_evaluate_worker, configurations))
+
+        return reports
@@ -0,0 +1,342 @@
+import argparse
+import math
+import os
+import sys
+import tempfile
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import torch
+from bert_score import BERTScorer
+from textstat import flesch_reading_ease
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import AutoModelForCausalLM, AutoTokenizer, BertConfig, BertModel, BertTokenizerFast, GPT2Config, \
+    GPT2LMHeadModel, PreTrainedTokenizerFast
+from transformers import logging
+
+logging.set_verbosity_error()
+
+# Pairs of reference and generated texts of the check, with repeated texts and a generated text of a single token
+CHECK_PAIRS = [
+    ('the assembly adopted the resolution on climate', 'the assembly adopted the resolution'),
+    ('the council discussed peace and security', 'peace and security were discussed by the council'),
+    ('the delegation supports sustainable development', 'the delegation supports the agenda'),
+    ('the assembly adopted the resolution on climate', 'climate'),
+    ('human rights are part of the agenda', 'the assembly adopted the resolution'),
+    ('the report of the session was adopted', 'the session adopted the report on human rights and climate'),
+]
+
+
+class TPPIResult(TypedDict):
+    TPPI: float
+    BertScore: float
+    Normalized_BertScore: float
+    Perplexity: float
+    Normalized_Perplexity: float
+    Flesch: float
+    Normalized_Flesch: float
+
+
+@lru_cache(maxsize=None)
+def load_bert_scorer(model_type: str, num_layers: Optional[int], batch_size: int, device: str) -> BERTScorer:
+    """
+    Load a BERTScore scorer once per process.
+    :param model_type: str Name or local path of the BERT model.
+    :param num_layers: Optional[int] Layer used for the embeddings, it is required for models unknown to bert_score.
+    :param batch_size: int Batch size of the scorer.
+    :param device: str Torch device.
+    :return: scorer: BERTScorer The scorer.
+    """
+    return BERTScorer(model_type=model_type, num_layers=num_layers, batch_size=batch_size, device=device)
+
+
+@lru_cache(maxsize=None)
+def load_causal_lm(model_name: str, device: str):
+    """
+    Load a causal language model and its tokenizer once per process.
+    :param model_name: str Name or local path of the model.
+    :param device: str Torch device.
+    :return: model The model in evaluation mode.
+             tokenizer The tokenizer, padding on the right.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = 'right'
+
+    model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
+    model.eval()
+
+    return model, tokenizer
+
+
+class TPPI:
+    """
+    Talking Point Performance Index. It combines the BERTScore between a reference and a generated text with the
+    perplexity and the Flesch reading ease of the generated text:
+        TPPI = 0.5 * normalized BERTScore + 0.25 * normalized perplexity + 0.25 * normalized Flesch
+
+    The texts are scored in padded mini-batches, the models are loaded once per process and the results are cached
+    per text (perplexity and Flesch) and per pair (BERTScore). Any model name or local path can be used, so small
+    randomly initialized models can replace bert-base-uncased and gpt2.
+    """
+
+    def __init__(self, model_type: str = 'bert-base-uncased', bert_num_layers: int = None,
+                 perplexity_model: str = 'gpt2', batch_size: int = 16, perplexity_max_length: int = 1024,
+                 device: str = None):
+        """
+        :param model_type: str Name or local path of the BERT model used by BERTScore.
+        :param bert_num_layers: int Layer used by BERTScore, required for models unknown to bert_score.
+        :param perplexity_model: str Name or local path of the causal language model used for the perplexity.
+        :param batch_size: int Number of texts per mini-batch.
+        :param perplexity_max_length: int Maximum number of tokens used to calculate the perplexity.
+        :param device: str Torch device, cuda when available if None.
+        """
+        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.batch_size = batch_size
+        self.perplexity_max_length = perplexity_max_length
+
+        self.scorer = load_bert_scorer(model_type, bert_num_layers, batch_size, self.device)
+        self.perplexity_model, self.perplexity_tokenizer = load_causal_lm(perplexity_model, self.device)
+
+        # Per text and per pair caches
+        self._bert_scores: Dict[Tuple[str, str], float] = {}
+        self._perplexities: Dict[str, float] = {}
+        self._flesch_scores: Dict[str, float] = {}
+
+    @staticmethod
+    def normalize_bert_score(bert_score: float) -> float:
+        """
+        Normalize the BERTScore in a range from 0 to 1.
+        """
+        return (bert_score + 1) / 2
+
+    @staticmethod
+    def normalize_perplexity(perplexity: float) -> float:
+        """
+        Normalize the perplexity in a range from 0 to 1, low perplexities give high normalized values.
+        """
+        # The minimum perplexity is 1 to avoid divisions by zero
+        perplexity = max(perplexity, 1)
+        return 1 - (min(perplexity, 100) - 1) / 99
+
+    @staticmethod
+    def normalize_flesch(flesch: float) -> float:
+        """
+        Normalize the Flesch reading ease in a range from 0 to 1.
+        """
+        return max(min(flesch, 100), 0) / 100
+
+    def calculate_bert_scores(self, reference_texts: List[str], generated_texts: List[str]) -> List[float]:
+        """
+        Calculate the BERTScore F1 of every pair of reference and generated texts.
+        :param reference_texts: List[str] The reference texts.
+        :param generated_texts: List[str] The generated texts.
+        :return: bert_scores: List[float] The BERTScore of every pair.
+        """
+        pairs = list(zip(reference_texts, generated_texts))
+        missing = list(dict.fromkeys(pair for pair in pairs if pair not in self._bert_scores))
+
+        if missing:
+            _, _, f1 = self.scorer.score([reference for reference, _ in missing],
+                                         [generated for _, generated in missing],
+                                         verbose=False, batch_size=self.batch_size)
+            self._bert_scores.update(zip(missing, f1.tolist()))
+
+        return [self._bert_scores[pair] for pair in pairs]
+
+    def calculate_perplexities(self, texts: List[str]) -> List[float]:
+        """
+        Calculate the perplexity of every text with the causal language model.
+        :param texts: List[str] The texts.
+        :return: perplexities: List[float] The perplexity of every text, nan for texts with less than two tokens.
+        """
+        missing = [text for text in dict.fromkeys(texts) if text not in self._perplexities]
+        if not missing:
+            return [self._perplexities[text] for text in texts]
+
+        # Sort the texts by length so the mini-batches need little padding
+        encodings = self.perplexity_tokenizer(missing, truncation=True, max_length=self.perplexity_max_length)
+        order = sorted(range(len(missing)), key=lambda index: len(encodings['input_ids'][index]))
+
+        for start in range(0, len(order), self.batch_size):
+            batch_indexes = order[start:start + self.batch_size]
+            batch = self.perplexity_tokenizer.pad(
+                {'input_ids': [encodings['input_ids'][index] for index in batch_indexes]},
+                return_tensors='pt'
+            ).to(self.device)
+
+            with torch.no_grad():
+                logits = self.perplexity_model(**batch).logits
+
+            # Mean negative log-likelihood of every text, ignoring the padding
+            shifted_logits = logits[:, :-1].float()
+            shifted_labels = batch['input_ids'][:, 1:]
+            shifted_mask = batch['attention_mask'][:, 1:].float()
+            losses = torch.nn.functional.cross_entropy(shifted_logits.transpose(1, 2), shifted_labels,
+                                                       reduction='none')
+            token_counts = shifted_mask.sum(dim=1)
+            mean_losses = (losses * shifted_mask).sum(dim=1) / token_counts.clamp(min=1)
+
+            for index, mean_loss, token_count in zip(batch_indexes, mean_losses.tolist(), token_counts.tolist()):
+                self._perplexities[missing[index]] = math.exp(mean_loss) if token_count > 0 else float('nan')
+
+        return [self._perplexities[text] for text in texts]
+
+    def calculate_flesch_scores(self, texts: List[str]) -> List[float]:
+        """
+        Calculate the Flesch reading ease of every text.
+        :param texts: List[str] The texts.
+        :return: flesch_scores: List[float] The Flesch reading ease of every text.
+        """
+        for text in texts:
+            if text not in self._flesch_scores:
+                self._flesch_scores[text] = flesch_reading_ease(text)
+
+        return [self._flesch_scores[text] for text in texts]
+
+    def calculate_tppi_batch(self, reference_texts: List[str], generated_texts: List[str]) -> List[TPPIResult]:
+        """
+        Calculate the TPPI of every pair of reference and generated texts, returning the BERTScore, perplexity and
+        Flesch scores both raw and normalized.
+        :param reference_texts: List[str] The reference texts.
+        :param generated_texts: List[str] The generated texts.
+        :return: results: List[TPPIResult] The results of every pair.
+        """
+        if len(reference_texts) != len(generated_texts):
+            raise ValueError("The number of reference and generated texts must be the same")
+
+        bert_scores = self.calculate_bert_scores(reference_texts, generated_texts)
+        perplexities = self.calculate_perplexities(generated_texts)
+        flesch_scores = self.calculate_flesch_scores(generated_texts)
+
+        results = []
+        for bert_score, perplexity, flesch in zip(bert_scores, perplexities, flesch_scores):
+            normalized_bert_score = self.normalize_bert_score(bert_score)
+            normalized_perplexity = self.normalize_perplexity(perplexity)
+            normalized_flesch = self.normalize_flesch(flesch)
+
+            tppi_score = 0.5 * normalized_bert_score + 0.25 * normalized_perplexity + 0.25 * normalized_flesch
+
+            results.append(TPPIResult(
+                TPPI=tppi_score,
+                BertScore=bert_score,
+                Normalized_BertScore=normalized_bert_score,
+                Perplexity=perplexity,
+                Normalized_Perplexity=normalized_perplexity,
+                Flesch=flesch,
+                Normalized_Flesch=normalized_flesch
+            ))
+
+        return results
+
+    def calculate_tppi(self, reference_text: str, generated_text: str) -> TPPIResult:
+        """
+        Calculate the TPPI of a single pair of reference and generated texts.
+        :param reference_text: str The reference text.
+        :param generated_text: str The generated text.
+        :return: result: TPPIResult The result of the pair.
+        """
+        return self.calculate_tppi_batch([reference_text], [generated_text])[0]
+
+
+def build_tiny_random_models(path: str, seed: int = 0) -> Tuple[str, str]:
+    """
+    Save a tiny randomly initialized BERT model and GPT-2 model, with a word level vocabulary of the check texts, so
+    the TPPI can be checked without downloading bert-base-uncased and gpt2.
+    :param path: str Folder where the models are saved.
+    :param seed: int Seed of the weights.
+    :return: bert_path: str Path of the BERT model, its embeddings are the ones of the second layer.
+             gpt2_path: str Path of the GPT-2 model.
+    """
+    words = sorted({word for pair in CHECK_PAIRS for text in pair for word in text.split()})
+    vocabulary = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '<eos>'] + words
+    torch.manual_seed(seed)
+
+    bert_path = os.path.join(path, 'bert')
+    os.makedirs(bert_path, exist_ok=True)
+    with open(os.path.join(bert_path, 'vocab.txt'), 'w') as file:
+        file.write('\n'.join(vocabulary))
+    BertTokenizerFast(os.path.join(bert_path, 'vocab.txt'), model_max_length=512).save_pretrained(bert_path)
+    BertModel(BertConfig(vocab_size=len(vocabulary), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                         intermediate_size=64)).save_pretrained(bert_path)
+
+    gpt2_path = os.path.join(path, 'gpt2')
+    tokenizer = Tokenizer(models.WordLevel({word: index for index, word in enumerate(vocabulary)}, unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token='<eos>', unk_token='[UNK]',
+                            model_max_length=512).save_pretrained(gpt2_path)
+    GPT2LMHeadModel(GPT2Config(vocab_size=len(vocabulary), n_positions=512, n_embd=32, n_layer=2,
+                               n_head=2)).save_pretrained(gpt2_path)
+
+    return bert_path, gpt2_path
+
+
+def check_tppi(tppi: TPPI, reference_texts: List[str], generated_texts: List[str],
+               tolerance: float = 1e-4) -> List[Dict[str, Any]]:
+    """
+    Compare the batched BERTScore and perplexity of a TPPI with the ones of every pair scored alone, as the notebooks
+    did: one scorer call per pair and the loss of the language model on the whole text.
+    :param tppi: TPPI The TPPI to check.
+    :param reference_texts: List[str] The reference texts.
+    :param generated_texts: List[str] The generated texts.
+    :param tolerance: float Maximum relative difference between the batched and single values.
+    :return: comparisons: List[Dict[str, Any]] The batched and single values of every pair and whether they match.
+    """
+    bert_scores = tppi.calculate_bert_scores(reference_texts, generated_texts)
+    perplexities = tppi.calculate_perplexities(generated_texts)
+
+    comparisons = []
+    for reference_text, generated_text, bert_score, batched_perplexity in zip(reference_texts, generated_texts,
+                                                                              bert_scores, perplexities):
+        _, _, f1 = tppi.scorer.score([reference_text], [generated_text], verbose=False)
+
+        input_ids = tppi.perplexity_tokenizer(generated_text, return_tensors='pt', truncation=True,
+                                              max_length=tppi.perplexity_max_length)['input_ids'].to(tppi.device)
+        with torch.no_grad():
+            loss = tppi.perplexity_model(input_ids, labels=input_ids).loss
+        perplexity = math.exp(loss.item())
+
+        # Texts of a single token have no perplexity in both cases
+        perplexity_matches = math.isclose(batched_perplexity, perplexity, rel_tol=tolerance) or \
+            (math.isnan(batched_perplexity) and math.isnan(perplexity))
+
+        comparisons.append({
+            'generated_text': generated_text,
+            'bert_score': (bert_score, f1.item()),
+            'perplexity': (batched_perplexity, perplexity),
+            'match': math.isclose(bert_score, f1.item(), rel_tol=tolerance, abs_tol=tolerance) and
+            perplexity_matches,
+        })
+
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the batched TPPI against single pair scoring with tiny "
+                                                 "randomly initialized models.")
+    parser.add_argument('--batch-size', type=int, default=4, help="Number of texts per mini-batch.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the weights of the models.")
+    parser.add_argument('--output', default=None, help="Folder of the models, a temporary one when not given.")
+    args = parser.parse_args()
+
+    output = args.output or tempfile.mkdtemp()
+    bert_path, gpt2_path = build_tiny_random_models(output, args.seed)
+
+    tppi = TPPI(model_type=bert_path, bert_num_layers=2, perplexity_model=gpt2_path, batch_size=args.batch_size,
+                device='cpu')
+    reference_texts = [reference for reference, _ in CHECK_PAIRS]
+    generated_texts = [generated for _, generated in CHECK_PAIRS]
+
+    comparisons = check_tppi(tppi, reference_texts, generated_texts)
+    for comparison in comparisons:
+        print(f"{'OK' if comparison['match'] else 'DIFFERENT'} {comparison['generated_text']!r}: "
+              f"BERTScore {comparison['bert_score'][0]:.6f} / {comparison['bert_score'][1]:.6f}, "
+              f"perplexity {comparison['perplexity'][0]:.4f} / {comparison['perplexity'][1]:.4f}")
+
+    if not all(comparison['match'] for comparison in comparisons):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import time
+from typing import List, Tuple
+
+import openai
+
+from src.unite_talking_points.utils.infrastructure.llm_usage import LLMUsage
+
+DEFAULT_COMPLETION_MODEL = "gpt-3.5-turbo-instruct"
+
+
+def complete_prompts(client: openai.OpenAI, prompts: List[str], batch_size: int,
+                     model: str = DEFAULT_COMPLETION_MODEL, usage: LLMUsage = None, service: str = 'completions',
+                     **completion_args) -> Tuple[List[str], int]:
+    """
+    Complete the prompts sending several of them in every completion request.
+
+    A batch rejected as a bad request is split in two halves that are sent again, so a single problematic prompt does
+    not make the whole batch fail. The other errors, such as rate limits or connection errors, are raised once the
+    client has retried them. The completions are returned in the order of the prompts.
+    :param client: openai.OpenAI The OpenAI client.
+    :param prompts: List[str] The prompts.
+    :param batch_size: int Maximum number of prompts per request.
+    :param model: str The completion model.
+    :param usage: LLMUsage Where every successful request is recorded, with the retries made by the client.
+    :param service: str The service recorded in the usage.
+    :param completion_args: Other arguments of the completion request, for example temperature or max_tokens.
+    :return: completions: List[str] The completion of every prompt.
+             n_requests: int The number of requests sent, including the failed ones.
+    """
+    completions = [None] * len(prompts)
+    n_requests = 0
+
+    def complete_batch(start: int, end: int):
+        nonlocal n_requests
+        n_requests += 1
+
+        try:
+            request_start = time.perf_counter()
+            raw_response = client.completions.with_raw_response.create(model=model, prompt=prompts[start:end],
+                                                                       **completion_args)
+            response = raw_response.parse()
+            latency_seconds = time.perf_counter() - request_start
+
+        except openai.BadRequestError:
+            # A single prompt cannot be split anymore
+            if end - start == 1:
+                raise
+
+            middle = (start + end) // 2
+            complete_batch(start, middle)
+            complete_batch(middle, end)
+
+        else:
+            # The choices are not guaranteed to be in the order of the prompts
+            for choice in response.choices:
+                completions[start + choice.index] = choice.text
+
+            if usage is not None:
+                usage.record(service, model, prompts[start:end], completions[start:end], latency_seconds,
+                             retries=getattr(raw_response, 'retries_taken', 0))
+
+    for batch_start in range(0, len(prompts), batch_size):
+        complete_batch(batch_start, min(batch_start + batch_size, len(prompts)))
+
+    return completions, n_requests
@@ -0,0 +1,109 @@
+import os
+import pickle
+from collections.abc import Sequence
+
+import numpy as np
+
+from src.unite_talking_points.domain.entities.entities import Document
+
+
+class DocumentStoreWriter:
+    """
+    Write Documents one by one to a document store, so they do not need to be kept in memory.
+
+    The store is a directory with records.pkl, the pickled Documents one after another, and offsets.npy, the position
+    of every record in records.pkl. The files are replaced when the writer is closed.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: str Directory of the store. It is created if it does not exist.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.records_path = os.path.join(directory, 'records.pkl')
+        self.offsets_path = os.path.join(directory, 'offsets.npy')
+
+        self._file = open(f'{self.records_path}.tmp', 'wb')
+        self._offsets = [0]
+
+    def append(self, document: Document) -> None:
+        """
+        Append a Document to the store.
+        :param document: Document The Document.
+        :return:
+        """
+        pickle.dump(document, self._file)
+        self._offsets.append(self._file.tell())
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def close(self) -> None:
+        """
+        Write the offsets of the records and replace the previous store.
+        :return:
+        """
+        self._file.close()
+
+        with open(f'{self.offsets_path}.tmp', 'wb') as file:
+            np.save(file, np.asarray(self._offsets, dtype=np.int64))
+
+        os.replace(f'{self.records_path}.tmp', self.records_path)
+        os.replace(f'{self.offsets_path}.tmp', self.offsets_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DocumentStore(Sequence):
+    """
+    A read-only list of the Documents of a document store. Every Document is read from disk when it is accessed.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: str Directory of the store.
+        """
+        self.directory = directory
+        self.records_path = os.path.join(directory, 'records.pkl')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        self._file = None
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """
+        Check if a directory contains a document store.
+        :param directory: str Directory path.
+        :return: bool Whether the store files are present.
+        """
+        return (os.path.isfile(os.path.join(directory, 'records.pkl')) and
+                os.path.isfile(os.path.join(directory, 'offsets.npy')))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Document index out of range")
+
+        if self._file is None:
+            self._file = open(self.records_path, 'rb')
+        self._file.seek(int(self.offsets[index]))
+
+        return pickle.load(self._file)
+
+    def __getstate__(self):
+        # The open file cannot be pickled, it is opened again on the first access
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
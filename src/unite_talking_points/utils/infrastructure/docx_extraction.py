@@ -0,0 +1,188 @@
+import posixpath
+import re
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional, Tuple
+from xml.etree import ElementTree
+
+# Namespaces of the WordprocessingML parts
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+DCTERMS = '{http://purl.org/dc/terms/}'
+RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+CONTENT_TYPES = '{http://schemas.openxmlformats.org/package/2006/content-types}'
+
+DOCUMENT_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml'
+
+OFFICE_DOCUMENT_RELATIONSHIP = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+CORE_PROPERTIES_RELATIONSHIP = \
+    'http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties'
+
+# Text of the run elements, as python-docx translates them
+_RUN_TEXT = {
+    f'{W}tab': '\t',
+    f'{W}ptab': '\t',
+    f'{W}cr': '\n',
+    f'{W}noBreakHyphen': '-',
+}
+
+_W3CDTF_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%Y-%m', '%Y')
+_OFFSET_PATTERN = re.compile(r'([+-])(\d\d):(\d\d)')
+
+
+class UnsupportedDocxError(ValueError):
+    """
+    The DOCX file has a layout that the streaming extractor does not handle, it has to be read with python-docx.
+    """
+    pass
+
+
+def _part_targets(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """
+    Read the package relationships to find the paths of the main document and the core properties.
+    :param archive: zipfile.ZipFile The DOCX archive.
+    :return: targets: Dict[str, str] The path in the archive of every relationship type.
+    """
+    with archive.open('_rels/.rels') as file:
+        relationships = ElementTree.parse(file).getroot()
+
+    return {
+        relationship.get('Type'): posixpath.normpath(relationship.get('Target', '').lstrip('/'))
+        for relationship in relationships.iter(f'{RELATIONSHIPS}Relationship')
+        if relationship.get('TargetMode') != 'External'
+    }
+
+
+def _document_content_type(archive: zipfile.ZipFile) -> Optional[str]:
+    """
+    Read the content type of word/document.xml.
+    :param archive: zipfile.ZipFile The DOCX archive.
+    :return: content_type: Optional[str] The content type or None if it is not declared.
+    """
+    with archive.open('[Content_Types].xml') as file:
+        content_types = ElementTree.parse(file).getroot()
+
+    for override in content_types.iter(f'{CONTENT_TYPES}Override'):
+        if override.get('PartName') == '/word/document.xml':
+            return override.get('ContentType')
+
+    return None
+
+
+def _run_text(run: ElementTree.Element) -> str:
+    parts = []
+    for child in run:
+        if child.tag == f'{W}t':
+            parts.append(child.text or '')
+        elif child.tag == f'{W}br':
+            # Only line breaks are text, page and column breaks are not
+            parts.append('\n' if child.get(f'{W}type', 'textWrapping') == 'textWrapping' else '')
+        else:
+            parts.append(_RUN_TEXT.get(child.tag, ''))
+
+    return ''.join(parts)
+
+
+def _paragraph_text(paragraph: ElementTree.Element) -> str:
+    # The runs of the paragraph and of its hyperlinks, like python-docx
+    parts = []
+    for child in paragraph:
+        if child.tag == f'{W}r':
+            parts.append(_run_text(child))
+        elif child.tag == f'{W}hyperlink':
+            parts.extend(_run_text(run) for run in child.iterfind(f'{W}r'))
+
+    return ''.join(parts)
+
+
+def iter_paragraph_texts(file) -> Iterator[str]:
+    """
+    Parse the paragraphs of the body of a word/document.xml part incrementally.
+
+    Only the current paragraph or table is kept in memory: every element of the body is discarded once it is parsed.
+    The paragraphs are the ones of python-docx Document.paragraphs, the paragraphs of the tables are not included.
+    :param file: The word/document.xml file object.
+    :return: texts: Iterator[str] The text of every paragraph.
+    """
+    body = None
+    depth = 0
+    for event, element in ElementTree.iterparse(file, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and element.tag == f'{W}body':
+                body = element
+            continue
+
+        depth -= 1
+        if depth == 2 and body is not None:
+            # A child of the body
+            if element.tag == f'{W}p':
+                yield _paragraph_text(element)
+            body.remove(element)
+
+    if body is None:
+        raise UnsupportedDocxError("The main document has no body")
+
+
+def parse_w3cdtf(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a W3CDTF date of the core properties, as python-docx does.
+    :param value: Optional[str] The date, for example 2003-12-31T10:14:55Z or 2003-12-31T10:14:55-08:00.
+    :return: date: Optional[datetime] The date in UTC or None if it cannot be parsed.
+    """
+    if not value:
+        return None
+
+    date = None
+    for date_format in _W3CDTF_FORMATS:
+        try:
+            date = datetime.strptime(value[:19], date_format)
+        except ValueError:
+            continue
+    if date is None:
+        return None
+
+    offset = value[19:]
+    if len(offset) == 6:
+        match = _OFFSET_PATTERN.match(offset)
+        if match is None:
+            return None
+        sign, hours, minutes = match.groups()
+        sign_factor = -1 if sign == '+' else 1
+        date += timedelta(hours=int(hours) * sign_factor, minutes=int(minutes) * sign_factor)
+
+    return date.replace(tzinfo=timezone.utc)
+
+
+def extract_docx(path: str) -> Tuple[str, str, Optional[datetime], Optional[datetime]]:
+    """
+    Extract the text and core properties of a DOCX file streaming its XML parts out of the zip archive, without
+    building the python-docx object model.
+    :param path: str Path to the DOCX file.
+    :return: content: str The paragraphs of the body separated by new lines.
+             author: str The author, empty if it is not set.
+             date_created: Optional[datetime] The creation date.
+             date_modified: Optional[datetime] The modification date.
+    """
+    with zipfile.ZipFile(path) as archive:
+        targets = _part_targets(archive)
+
+        # Packages with other part names are left to python-docx
+        if targets.get(OFFICE_DOCUMENT_RELATIONSHIP) != 'word/document.xml':
+            raise UnsupportedDocxError("The main document is not word/document.xml")
+        if targets.get(CORE_PROPERTIES_RELATIONSHIP) != 'docProps/core.xml':
+            raise UnsupportedDocxError("The core properties are not docProps/core.xml")
+        if _document_content_type(archive) != DOCUMENT_CONTENT_TYPE:
+            raise UnsupportedDocxError("The main document is not a Word document")
+
+        with archive.open('docProps/core.xml') as file:
+            core_properties = ElementTree.parse(file).getroot()
+
+        with archive.open('word/document.xml') as file:
+            content = '\n'.join(iter_paragraph_texts(file))
+
+    author = core_properties.findtext(f'{DC}creator') or ''
+    date_created = parse_w3cdtf(core_properties.findtext(f'{DCTERMS}created'))
+    date_modified = parse_w3cdtf(core_properties.findtext(f'{DCTERMS}modified'))
+
+    return content, author, date_created, date_modified
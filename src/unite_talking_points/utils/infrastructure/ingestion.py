@@ -1,10 +1,13 @@
-from typing import List
+import zipfile
+from typing import Iterator, List, Optional
+from xml.etree import ElementTree
 
 import PyPDF2
 import docx
 
 from src.unite_talking_points.domain.entities.entities import Document
 from src.unite_talking_points.utils.directory.directory_utils import get_file_paths
+from src.unite_talking_points.utils.infrastructure.docx_extraction import extract_docx, UnsupportedDocxError
 
 
 def load_pdf_document(path: str) -> Document:
@@ -22,10 +25,11 @@ def load_pdf_document(path: str) -> Document:
             page = reader.pages[page_number]
             text += page.extract_text()
 
-        # Extract metadata
-        author = reader.metadata.get("Author", None)
-        date_created = reader.metadata.get("creation_date", None)
-        date_modified = reader.metadata.get("modification_date", None)
+        # Extract metadata, the dates are parsed by PyPDF2 and the files without information dictionary have none
+        metadata = reader.metadata
+        author = metadata.author if metadata is not None else None
+        date_created = metadata.creation_date if metadata is not None else None
+        date_modified = metadata.modification_date if metadata is not None else None
 
     # Create the Document object
     document = Document(content=text,
@@ -72,30 +76,89 @@ def load_word_document(path: str) -> Document:
     return document
 
 
-def load_documents(directory: str) -> List[Document]:
+def load_word_document_streaming(path: str) -> Document:
     """
-    Loads all documents in a given directory into a list of Documents objects.
-    :param directory: str The directory path.
+    Load a Word document streaming its XML out of the zip archive, which is faster and uses less memory than
+    building the python-docx object model. Unusual files are loaded with python-docx.
+    :param path: str Path to the Word document.
+    :return: document: Document object.
+    """
+    try:
+        content, author, date_created, date_modified = extract_docx(path)
+    except (UnsupportedDocxError, KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        return load_word_document(path)
+
+    # Create the Document object
+    document = Document(content=content,
+                        _id=None,
+                        origin=None,
+                        title=None,
+                        author=author,
+                        keywords=None,
+                        date_created=date_created,
+                        date_modified=date_modified,
+                        source=path)
+
+    return document
+
+
+def load_document(path: str) -> Optional[Document]:
+    """
+    Load a supported document into a Document object.
+    :param path: str Path to the document.
+    :return: document: Optional[Document] The Document object or None if it is not supported or empty.
+    """
+    if path.endswith(".pdf") or path.endswith(".PDF"):
+        document = load_pdf_document(path)
+
+    elif path.endswith(".docx"):
+        document = load_word_document_streaming(path)
+
+    else:
+        print(f"WARNING: Unsupported document extension for: {path}")
+        return None
+
+    if not document.content:
+        print(f"WARNING: Empty document found for: {path}")
+        return None
+
+    return document
+
+
+def load_documents_from_paths(file_list: List[str]) -> List[Document]:
+    """
+    Loads the given documents into a list of Documents objects.
+    :param file_list: List[str] The documents paths.
     :return: documents: List[Document] A list of Documents objects.
     """
-    file_list = get_file_paths(directory)
     documents = []
 
     for path in file_list:
-        if path.endswith(".pdf") or path.endswith(".PDF"):
-            document = load_pdf_document(path)
+        document = load_document(path)
+        if document is not None:
+            documents.append(document)
 
-        elif path.endswith(".docx"):
-            document = load_word_document(path)
+    return documents
 
-        else:
-            print(f"WARNING: Unsupported document extension for: {path}")
-            continue
 
-        if document.content:
-            documents.append(document)
+def iter_documents(directory: str) -> Iterator[Document]:
+    """
+    Loads the documents in a given directory one by one, so they do not need to be kept in memory.
+    :param directory: str The directory path.
+    :return: documents: Iterator[Document] A generator of Documents objects.
+    """
+    for path in get_file_paths(directory):
+        document = load_document(path)
+        if document is not None:
+            yield document
 
-        else:
-            print(f"WARNING: Empty document found for: {path}")
 
-    return documents
+def load_documents(directory: str) -> List[Document]:
+    """
+    Loads all documents in a given directory into a list of Documents objects.
+    :param directory: str The directory path.
+    :return: documents: List[Document] A list of Documents objects.
+    """
+    file_list = get_file_paths(directory)
+
+    return load_documents_from_paths(file_list)
@@ -0,0 +1,285 @@
+import json
+import math
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, TypedDict
+from uuid import UUID
+
+import httpx
+import openai
+import tiktoken
+from langchain.callbacks.base import BaseCallbackHandler
+
+# Price in dollars per 1000 prompt and completion tokens of the completion models
+TOKEN_PRICES = {
+    'gpt-3.5-turbo-instruct': (0.0015, 0.002),
+    'text-davinci-003': (0.02, 0.02),
+}
+
+
+class LLMCallRecord(TypedDict):
+    timestamp: str
+    request_id: str
+    service: str
+    model: str
+    prompts: int
+    prompt_tokens: int
+    completion_tokens: int
+    latency_seconds: float
+    retries: int
+    cache_hit: bool
+    cost: Optional[float]
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """
+    Get the tiktoken encoding of a model, cl100k_base for the models tiktoken does not know.
+    :param model: str The model name.
+    :return: encoding: tiktoken.Encoding The encoding.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(texts: List[str], model: str) -> int:
+    """
+    Count the tokens of some texts with the encoding of a model.
+    :param texts: List[str] The texts.
+    :param model: str The model name.
+    :return: n_tokens: int The total number of tokens.
+    """
+    encoding = get_encoding(model)
+    return sum(len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=()))
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    Estimate the cost of a call with the prices of TOKEN_PRICES.
+    :param model: str The model name.
+    :param prompt_tokens: int Number of prompt tokens.
+    :param completion_tokens: int Number of completion tokens.
+    :return: cost: Optional[float] The cost in dollars or None if the price of the model is unknown.
+    """
+    if model not in TOKEN_PRICES:
+        return None
+
+    prompt_price, completion_price = TOKEN_PRICES[model]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class LLMUsage:
+    """
+    The record of the LLM calls of a request or a session, with the prompt and completion tokens, latency, retries
+    and cache hits of every call.
+    """
+
+    def __init__(self, request_id: str = None):
+        """
+        :param request_id: str The identifier of the request of the calls, a random one when None.
+        """
+        self.request_id = request_id or uuid.uuid4().hex
+        self.records: List[LLMCallRecord] = []
+
+    def record(self, service: str, model: str, prompts: List[str], completions: List[str], latency_seconds: float,
+               retries: int = 0, cache_hit: bool = False) -> LLMCallRecord:
+        """
+        Record an LLM call, the tokens are counted with tiktoken.
+        :param service: str The service that made the call.
+        :param model: str The model name.
+        :param prompts: List[str] The prompts of the call.
+        :param completions: List[str] The completions of the call.
+        :param latency_seconds: float The time of the call.
+        :param retries: int Number of times the call was retried.
+        :param cache_hit: bool Whether the call was answered by a cache, cached calls do not use tokens.
+        :return: record: LLMCallRecord The record.
+        """
+        prompt_tokens = 0 if cache_hit else count_tokens(prompts, model)
+        completion_tokens = 0 if cache_hit else count_tokens(completions, model)
+
+        record = LLMCallRecord(timestamp=datetime.now(timezone.utc).isoformat(),
+                               request_id=self.request_id,
+                               service=service,
+                               model=model,
+                               prompts=len(prompts),
+                               prompt_tokens=prompt_tokens,
+                               completion_tokens=completion_tokens,
+                               latency_seconds=latency_seconds,
+                               retries=retries,
+                               cache_hit=cache_hit,
+                               cost=0.0 if cache_hit else estimate_cost(model, prompt_tokens, completion_tokens))
+        self.records.append(record)
+
+        return record
+
+    def extend(self, usage: 'LLMUsage') -> None:
+        """
+        Add the records of another usage, for example the ones of a request to the ones of a session.
+        :param usage: LLMUsage The other usage.
+        :return:
+        """
+        self.records.extend(usage.records)
+
+    def totals(self) -> Dict[str, Any]:
+        """
+        Add up the records.
+        :return: totals: Dict[str, Any] The number of calls, prompts, tokens, latency, retries, cache hits and cost.
+        The cost is None if the price of any model is unknown.
+        """
+        costs = [record['cost'] for record in self.records]
+        prompt_tokens = sum(record['prompt_tokens'] for record in self.records)
+        completion_tokens = sum(record['completion_tokens'] for record in self.records)
+
+        return {
+            'calls': len(self.records),
+            'prompts': sum(record['prompts'] for record in self.records),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'latency_seconds': sum(record['latency_seconds'] for record in self.records),
+            'retries': sum(record['retries'] for record in self.records),
+            'cache_hits': sum(record['cache_hit'] for record in self.records),
+            'cost': None if None in costs else sum(costs),
+        }
+
+    def summary(self) -> str:
+        """
+        Format the totals in a single line.
+        :return: summary: str The summary.
+        """
+        totals = self.totals()
+        cost = 'unknown cost' if totals['cost'] is None else f"${totals['cost']:.4f}"
+
+        return (f"{totals['calls']} LLM calls, {totals['prompt_tokens']} prompt + {totals['completion_tokens']} "
+                f"completion tokens, {totals['latency_seconds']:.2f} s, {totals['retries']} retries, "
+                f"{totals['cache_hits']} cache hits, {cost}")
+
+    def export_jsonl(self, path: str, **fields: Any) -> None:
+        """
+        Append the records to a JSON lines file.
+        :param path: str Path of the file.
+        :param fields: Other fields added to every record, for example the session.
+        :return:
+        """
+        with open(path, 'a', encoding='utf-8') as file:
+            for record in self.records:
+                file.write(json.dumps({**record, **fields}) + '\n')
+
+    def __len__(self):
+        return len(self.records)
+
+
+class HTTPRequestCounter:
+    """
+    An httpx request hook that counts the HTTP requests sent by a client.
+
+    The OpenAI client retries the failed requests by itself without telling LangChain, so the retries of a call are
+    the requests sent beyond the ones the call needs.
+    """
+
+    def __init__(self):
+        self.requests = 0
+
+    def __call__(self, request: httpx.Request) -> None:
+        self.requests += 1
+
+    def http_client(self) -> httpx.Client:
+        """
+        Build an httpx client with the defaults of the OpenAI client that counts its requests.
+        :return: http_client: httpx.Client The client.
+        """
+        return openai.DefaultHttpxClient(event_hooks={'request': [self]})
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """
+    A LangChain callback handler that records the LLM calls of the chains in an LLMUsage.
+
+    The calls answered by the LangChain cache do not reach the callbacks, so a chain run that does not call the model
+    is recorded as a cache hit. LangChain opens a run per prompt, the runs of a generate call are recorded together
+    as a single call. The retries are only recorded when the HTTP requests of the model are counted.
+    """
+
+    def __init__(self, usage: LLMUsage, service: str, model: str, request_counter: HTTPRequestCounter = None,
+                 prompts_per_request: int = 1):
+        """
+        :param usage: LLMUsage The usage where the calls are recorded.
+        :param service: str The service that runs the chains.
+        :param model: str The model name of the chains.
+        :param request_counter: HTTPRequestCounter The counter of the HTTP client of the model.
+        :param prompts_per_request: int Number of prompts the model sends in every request, its batch_size.
+        """
+        self.usage = usage
+        self.service = service
+        self.model = model
+        self.request_counter = request_counter
+        self.prompts_per_request = prompts_per_request
+        self._llm_runs: Dict[UUID, Optional[UUID]] = {}
+        self._llm_calls: Dict[Optional[UUID], Dict[str, Any]] = {}
+        self._chain_runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id is None:
+            self._chain_runs[run_id] = {'start': time.perf_counter(), 'llm_calls': len(self.usage)}
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        chain_run = self._chain_runs.pop(run_id, None)
+        if chain_run is not None and len(self.usage) == chain_run['llm_calls']:
+            self.usage.record(self.service, self.model, [], [], time.perf_counter() - chain_run['start'],
+                              cache_hit=True)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._chain_runs.pop(run_id, None)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        # LangChain opens a run per prompt, the runs of a generate call start together before any of them ends
+        llm_call = self._llm_calls.get(parent_run_id)
+        if llm_call is None or llm_call['ended']:
+            requests = self.request_counter.requests if self.request_counter is not None else None
+            llm_call = {'start': time.perf_counter(), 'requests': requests, 'prompts': [], 'run_ids': [],
+                        'pending': set(), 'completions': {}, 'ended': False}
+            self._llm_calls[parent_run_id] = llm_call
+
+        llm_call['prompts'].extend(prompts)
+        llm_call['run_ids'].append(run_id)
+        llm_call['pending'].add(run_id)
+        self._llm_runs[run_id] = parent_run_id
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id not in self._llm_runs:
+            return
+        parent_run_id = self._llm_runs.pop(run_id)
+        llm_call = self._llm_calls.get(parent_run_id)
+        if llm_call is None or run_id not in llm_call['pending']:
+            return
+
+        llm_call['ended'] = True
+        llm_call['pending'].discard(run_id)
+        llm_call['completions'][run_id] = [generation.text for generations in response.generations
+                                           for generation in generations]
+        if llm_call['pending']:
+            return
+
+        # The whole generate call is recorded once, the model sends one request per prompts_per_request prompts and
+        # the other requests are retries
+        del self._llm_calls[parent_run_id]
+        retries = 0
+        if llm_call['requests'] is not None:
+            sent_requests = self.request_counter.requests - llm_call['requests']
+            retries = max(0, sent_requests - math.ceil(len(llm_call['prompts']) / self.prompts_per_request))
+
+        completions = [completion for call_run_id in llm_call['run_ids']
+                       for completion in llm_call['completions'][call_run_id]]
+        self.usage.record(self.service, self.model, llm_call['prompts'], completions,
+                          time.perf_counter() - llm_call['start'], retries=retries)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # The generate call failed, none of its runs is recorded
+        if run_id in self._llm_runs:
+            self._llm_calls.pop(self._llm_runs.pop(run_id), None)
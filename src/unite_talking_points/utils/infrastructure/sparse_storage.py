@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import scipy as sp
+
+CSR_ARRAYS = ('data', 'indices', 'indptr')
+
+# Number of elements copied at once when assembling the arrays on disk
+COPY_CHUNK_SIZE = 2 ** 22
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    """
+    Save an array as a .npy file through a temporary file, so processes that memory-mapped the previous file keep
+    reading it until they load the new one.
+    :param path: str Path of the .npy file.
+    :param array: np.ndarray The array.
+    :return:
+    """
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.save(file, array)
+    os.replace(temporary_path, path)
+
+
+def save_csr_matrix(directory: str, matrix) -> None:
+    """
+    Save a CSR matrix as uncompressed .npy arrays so it can be memory-mapped when loaded.
+
+    The directory will contain data.npy, indices.npy, indptr.npy and shape.npy.
+    :param directory: str Directory where the arrays are written. It is created if it does not exist.
+    :param matrix: Sparse matrix to save, it is converted to CSR if needed.
+    :return:
+    """
+    os.makedirs(directory, exist_ok=True)
+    matrix = sp.sparse.csr_matrix(matrix)
+
+    for name in CSR_ARRAYS:
+        _save_array(os.path.join(directory, f'{name}.npy'), getattr(matrix, name))
+    _save_array(os.path.join(directory, 'shape.npy'), np.asarray(matrix.shape, dtype=np.int64))
+
+
+def load_csr_matrix(directory: str, mmap: bool = True):
+    """
+    Load a CSR matrix saved with save_csr_matrix.
+
+    When memory-mapped, the arrays are opened read-only with numpy.memmap. Every process that loads the same matrix
+    shares a single copy in the OS page cache and the loading time does not depend on the matrix size.
+    :param directory: str Directory where the arrays were written.
+    :param mmap: bool Whether to memory-map the arrays instead of reading them into memory.
+    :return: matrix CSR sparse matrix backed by the arrays on disk.
+    """
+    mmap_mode = 'r' if mmap else None
+    data, indices, indptr = (np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                             for name in CSR_ARRAYS)
+    shape = tuple(int(size) for size in np.load(os.path.join(directory, 'shape.npy')))
+
+    return sp.sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def is_csr_directory(directory: str) -> bool:
+    """
+    Check if a directory contains a CSR matrix saved with save_csr_matrix.
+    :param directory: str Directory path.
+    :return: bool Whether all the arrays are present.
+    """
+    return all(os.path.isfile(os.path.join(directory, f'{name}.npy')) for name in CSR_ARRAYS + ('shape',))
+
+
+class CSRMatrixWriter:
+    """
+    Write a CSR matrix to disk by blocks of rows, in the same layout as save_csr_matrix.
+
+    Only the current block is kept in memory: the data and indices of the blocks are appended to raw files that are
+    copied by chunks into the .npy arrays when the writer is closed.
+    """
+
+    def __init__(self, directory: str, n_columns: int):
+        """
+        :param directory: str Directory where the arrays are written. It is created if it does not exist.
+        :param n_columns: int Number of columns of the matrix.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.n_columns = n_columns
+        self.n_rows = 0
+        self.nnz = 0
+        self.data_dtype = None
+
+        self._raw_paths = {name: os.path.join(directory, f'{name}.raw') for name in CSR_ARRAYS}
+        self._raw_files = {name: open(path, 'wb') for name, path in self._raw_paths.items()}
+
+    def append(self, block) -> None:
+        """
+        Append a block of rows.
+        :param block: Sparse matrix with the rows, it is converted to CSR if needed.
+        :return:
+        """
+        block = sp.sparse.csr_matrix(block)
+        if block.shape[1] != self.n_columns:
+            raise ValueError(f"The block has {block.shape[1]} columns instead of {self.n_columns}")
+        if self.data_dtype is None:
+            self.data_dtype = block.data.dtype
+
+        block.data.astype(self.data_dtype, copy=False).tofile(self._raw_files['data'])
+        block.indices.astype(np.int64, copy=False).tofile(self._raw_files['indices'])
+        (block.indptr[1:].astype(np.int64) + self.nnz).tofile(self._raw_files['indptr'])
+
+        self.n_rows += block.shape[0]
+        self.nnz += block.nnz
+
+    def close(self) -> None:
+        """
+        Assemble the .npy arrays from the raw files and remove them.
+        :return:
+        """
+        for file in self._raw_files.values():
+            file.close()
+
+        # Indices and index pointers share the smallest integer type that fits, as scipy expects
+        index_dtype = np.int32 if max(self.nnz, self.n_columns) <= np.iinfo(np.int32).max else np.int64
+        dtypes = {'data': self.data_dtype or np.float64, 'indices': index_dtype, 'indptr': index_dtype}
+        sizes = {'data': self.nnz, 'indices': self.nnz, 'indptr': self.n_rows + 1}
+        raw_dtypes = {'data': dtypes['data'], 'indices': np.int64, 'indptr': np.int64}
+
+        for name in CSR_ARRAYS:
+            path = os.path.join(self.directory, f'{name}.npy')
+            temporary_path = f'{path}.tmp'
+            array = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=dtypes[name], shape=(sizes[name],))
+
+            # The first index pointer is always 0
+            offset = 1 if name == 'indptr' else 0
+            if name == 'indptr':
+                array[0] = 0
+
+            raw_size = sizes[name] - offset
+            if raw_size > 0:
+                raw = np.memmap(self._raw_paths[name], dtype=raw_dtypes[name], mode='r', shape=(raw_size,))
+                for start in range(0, raw_size, COPY_CHUNK_SIZE):
+                    end = min(start + COPY_CHUNK_SIZE, raw_size)
+                    array[offset + start:offset + end] = raw[start:end]
+                del raw
+
+            array.flush()
+            del array
+            os.replace(temporary_path, path)
+            os.remove(self._raw_paths[name])
+
+        shape = np.asarray((self.n_rows, self.n_columns), dtype=np.int64)
+        _save_array(os.path.join(self.directory, 'shape.npy'), shape)
@@ -0,0 +1,145 @@
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple
+
+import spacy
+
+
+class LemmaAnalyzer:
+    """
+    A text analyzer shared by the indexing and the querying of the documents.
+
+    At index time the documents are lemmatized with spaCy and, while doing so, a lookup table from every surface form
+    to its most frequent lemma is recorded. At query time the lookup table is used instead of spaCy, so the query terms
+    match the lemmatized vocabulary without paying the cost of loading and running the spaCy pipeline.
+    """
+
+    def __init__(self, spacy_model: str = "en_core_web_sm", cache_size: int = 1024):
+        """
+        :param spacy_model: str Name of the spaCy model used to lemmatize the documents.
+        :param cache_size: int Maximum number of query vectors kept in the LRU cache.
+        """
+        self.spacy_model = spacy_model
+        self.cache_size = cache_size
+
+        # Lookup tables built from the indexed documents
+        self.lemma_table: Dict[str, str] = {}
+        self.stop_words = frozenset()
+
+        # Fitted vectorizer and query vector cache, bound at runtime
+        self.vectorizer = None
+        self._cache = OrderedDict()
+
+        # spaCy pipeline, loaded on the first lemmatization
+        self._nlp = None
+
+    @staticmethod
+    def clean(text: str) -> str:
+        """
+        Remove non-letter characters and convert to lowercase.
+        :param text: str Text to clean.
+        :return: text: str The cleaned text.
+        """
+        return re.sub(r'[^a-zA-Z\s]', '', text.lower())
+
+    def lemmatize_documents(self, texts: Iterable[str]) -> Tuple[List[str], Dict[str, Counter], Set[str]]:
+        """
+        Lemmatize the texts with spaCy, counting the lemmas of every surface form.
+        :param texts: Iterable[str] Texts to lemmatize.
+        :return: lemmatized_texts: List[str] The lemmatized texts.
+                 lemma_counts: Dict[str, Counter] The lemma counts of every surface form.
+                 stop_words: Set[str] The stop words.
+        """
+        if self._nlp is None:
+            self._nlp = spacy.load(self.spacy_model)
+        nlp = self._nlp
+
+        lemma_counts: Dict[str, Counter] = {}
+        stop_words = set(nlp.Defaults.stop_words)
+
+        lemmatized_texts = []
+        for doc in nlp.pipe(self.clean(text) for text in texts):
+            lemmas = []
+            for token in doc:
+                if token.is_stop:
+                    stop_words.add(token.text)
+                    continue
+
+                lemmas.append(token.lemma_)
+                if not token.is_space:
+                    lemma_counts.setdefault(token.text, Counter())[token.lemma_] += 1
+
+            lemmatized_texts.append(' '.join(lemmas))
+
+        return lemmatized_texts, lemma_counts, stop_words
+
+    def build_table(self, lemma_counts: Dict[str, Counter], stop_words: Set[str]):
+        """
+        Build the lemma lookup table keeping the most frequent lemma of each surface form.
+        :param lemma_counts: Dict[str, Counter] The lemma counts of every surface form.
+        :param stop_words: Set[str] The stop words.
+        :return:
+        """
+        self.lemma_table = {text: counts.most_common(1)[0][0] for text, counts in lemma_counts.items()}
+        self.stop_words = frozenset(stop_words)
+
+    def fit_lemmatize(self, texts: Iterable[str]) -> List[str]:
+        """
+        Lemmatize the texts with spaCy and build the lemma lookup table used at query time.
+        :param texts: Iterable[str] Texts to lemmatize.
+        :return: lemmatized_texts: List[str] The lemmatized texts.
+        """
+        lemmatized_texts, lemma_counts, stop_words = self.lemmatize_documents(texts)
+        self.build_table(lemma_counts, stop_words)
+
+        return lemmatized_texts
+
+    def lemmatize(self, text: str) -> str:
+        """
+        Lemmatize a text with the lookup table. Unknown words are kept as they are.
+        :param text: str Text to lemmatize.
+        :return: lemmatized text: str The lemmatized text.
+        """
+        lemmas = [self.lemma_table.get(word, word) for word in self.clean(text).split() if word not in self.stop_words]
+
+        return ' '.join(lemmas)
+
+    def bind(self, vectorizer):
+        """
+        Bind the fitted vectorizer used to transform the queries. The query vector cache is cleared.
+        :param vectorizer: The fitted scikit-learn vectorizer.
+        :return:
+        """
+        self.vectorizer = vectorizer
+        self._cache.clear()
+
+    def transform(self, query: str):
+        """
+        Lemmatize and vectorize a query, reusing the cached vector when the query was already seen.
+        :param query: str The query.
+        :return: query_vector Sparse matrix with a single row.
+        """
+        if self.vectorizer is None:
+            raise ValueError("The analyzer has no vectorizer bound")
+
+        query_vector = self._cache.get(query)
+        if query_vector is not None:
+            self._cache.move_to_end(query)
+            return query_vector
+
+        query_vector = self.vectorizer.transform([self.lemmatize(query)])
+
+        self._cache[query] = query_vector
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return query_vector
+
+    def __getstate__(self):
+        # The vectorizer is persisted on its own, the cache is only valid during the process lifetime and the spaCy
+        # pipeline is not needed at query time
+        state = self.__dict__.copy()
+        state['vectorizer'] = None
+        state['_cache'] = OrderedDict()
+        state['_nlp'] = None
+        return state
@@ -0,0 +1,172 @@
+import re
+from typing import Iterator, List
+
+import numpy as np
+import scipy as sp
+from sklearn.preprocessing import normalize
+
+from src.unite_talking_points.utils.nlp.analyzer import LemmaAnalyzer
+from src.unite_talking_points.utils.nlp.ranking import top_k
+
+# Candidate sentence ends: a final punctuation mark with its closing quotes or brackets followed by whitespace, and
+# blank lines between paragraphs
+SENTENCE_END = re.compile(r'([.!?])["\')\]]*\s+|\n\s*\n')
+
+# The word before the period of a candidate end, with the periods of abbreviations such as U.S. or e.g. It is looked
+# for in the last LAST_WORD_WINDOW characters, so every candidate end costs the same
+LAST_WORD = re.compile(r'[\w.]*$')
+LAST_WORD_WINDOW = 32
+
+# Acronyms with periods, such as U.S or e.g without their last period. Decimals and web addresses do not match
+DOTTED_ACRONYM = re.compile(r'(?:[A-Za-z]\.)+[A-Za-z]')
+
+# Abbreviations followed by a period that do not end a sentence, in lower case and without their last period. The
+# initials and the acronyms with periods, such as U.S. or e.g., are recognized by their shape
+ABBREVIATIONS = frozenset({
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'gen', 'gov', 'sen', 'rep', 'amb', 'hon', 'rev',
+    'no', 'nos', 'art', 'arts', 'para', 'paras', 'sect', 'ch', 'vol', 'fig', 'pp', 'ed', 'eds',
+    'cf', 'etc', 'vs', 'al', 'approx', 'inc', 'ltd', 'co', 'corp', 'dept', 'est',
+    'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+})
+
+
+def _is_sentence_end(text: str, match: re.Match) -> bool:
+    """
+    Decide whether a candidate end of SENTENCE_END ends a sentence.
+    :param text: str The text.
+    :param match: re.Match The candidate end.
+    :return: is_end: bool False when the next sentence does not start with an upper case letter, a digit, a quote or
+    a bracket, and after abbreviations, acronyms with periods and initials.
+    """
+    # Paragraph breaks always end a sentence
+    if match.group(1) is None:
+        return True
+
+    next_character = text[match.end():match.end() + 1]
+    if next_character and not (next_character.isupper() or next_character.isdigit() or next_character in '"\'(['):
+        return False
+
+    if match.group(1) == '.':
+        word = LAST_WORD.search(text, max(0, match.start() - LAST_WORD_WINDOW), match.start()).group().strip('.')
+        if len(word) == 1 and word.isalpha() or DOTTED_ACRONYM.fullmatch(word) or word.lower() in ABBREVIATIONS:
+            return False
+
+    return True
+
+
+def _iter_sentences(text: str) -> Iterator[str]:
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if _is_sentence_end(text, match):
+            yield text[start:match.end()]
+            start = match.end()
+
+    yield text[start:]
+
+
+def split_sentences(text: str, min_words: int = 3) -> List[str]:
+    """
+    Split a text into sentences. The line breaks inside a sentence, common in extracted PDF text, are removed.
+
+    A period, question or exclamation mark ends a sentence when the next word starts with an upper case letter, a digit,
+    a quote or a bracket. Periods of abbreviations (Mr., No., para.), acronyms (U.S., e.g.) and initials do not, so a
+    sentence that really ends with one of them is joined with the next one.
+    :param text: str The text.
+    :param min_words: int Minimum number of words of a sentence, shorter fragments such as page numbers are dropped.
+    :return: sentences: List[str] The sentences in text order.
+    """
+    sentences = (' '.join(sentence.split()) for sentence in _iter_sentences(text))
+
+    return [sentence for sentence in sentences if len(sentence.split()) >= min_words]
+
+
+def textrank_scores(vectors, damping: float = 0.85, min_similarity: float = 0.0, tolerance: float = 1e-6,
+                    max_iterations: int = 100) -> np.ndarray:
+    """
+    Rank the sentences by their centrality in the graph of cosine similarities between them, with PageRank.
+    :param vectors: Sparse matrix with the vector of every sentence.
+    :param damping: float Probability of following an edge of the graph instead of jumping to a random sentence.
+    :param min_similarity: float Similarities below this value are not edges, which keeps the graph sparse.
+    :param tolerance: float The iterations stop when the scores change less than this value.
+    :param max_iterations: int Maximum number of iterations.
+    :return: scores: np.ndarray The score of every sentence, they add up to 1.
+    """
+    n_sentences = vectors.shape[0]
+    if n_sentences == 0:
+        return np.zeros(0)
+
+    # Cosine similarity graph without self loops
+    vectors = normalize(sp.sparse.csr_matrix(vectors, dtype=np.float64))
+    graph = (vectors @ vectors.T).tocsr()
+    graph.setdiag(0)
+    if min_similarity > 0:
+        graph.data[graph.data < min_similarity] = 0
+    graph.eliminate_zeros()
+
+    # Transition matrix, the sentences without edges jump to any sentence
+    out_weights = np.asarray(graph.sum(axis=1)).ravel()
+    dangling = out_weights == 0
+    transition = sp.sparse.diags(np.divide(1.0, out_weights, out=np.zeros(n_sentences), where=~dangling)) @ graph
+    transition = transition.T.tocsr()
+
+    scores = np.full(n_sentences, 1.0 / n_sentences)
+    for _ in range(max_iterations):
+        new_scores = damping * (transition @ scores + scores[dangling].sum() / n_sentences) + \
+            (1 - damping) / n_sentences
+        converged = np.abs(new_scores - scores).sum() < tolerance
+        scores = new_scores
+        if converged:
+            break
+
+    return scores
+
+
+class TextRankSummarizer:
+    """
+    A local extractive summarizer. The sentences are vectorized with the fitted vectorizer of a repository, ranked
+    with TextRank and the best ones are returned in text order, without calling any model.
+    """
+
+    def __init__(self, vectorizer, analyzer: LemmaAnalyzer = None, n_sentences: int = 5, damping: float = 0.85,
+                 min_similarity: float = 0.0):
+        """
+        :param vectorizer: The fitted scikit-learn vectorizer of the repository.
+        :param analyzer: LemmaAnalyzer The analyzer of the repository, the sentences are lemmatized with it before
+        being vectorized. Repositories without analyzer vectorize the sentences as they are.
+        :param n_sentences: int Number of sentences of the summaries.
+        :param damping: float Damping factor of TextRank.
+        :param min_similarity: float Minimum similarity between two sentences to link them.
+        """
+        self.vectorizer = vectorizer
+        self.analyzer = analyzer
+        self.n_sentences = n_sentences
+        self.damping = damping
+        self.min_similarity = min_similarity
+
+    def vectorize(self, sentences: List[str]):
+        """
+        Vectorize sentences the same way as the documents of the repository.
+        :param sentences: List[str] The sentences.
+        :return: vectors Sparse matrix with the vector of every sentence.
+        """
+        if self.analyzer is not None:
+            sentences = [self.analyzer.lemmatize(sentence) for sentence in sentences]
+
+        return self.vectorizer.transform(sentences)
+
+    def summarize(self, text: str, n_sentences: int = None) -> str:
+        """
+        Summarize a text with its most central sentences.
+        :param text: str The text.
+        :param n_sentences: int Number of sentences of the summary, the one of the summarizer when None.
+        :return: summary: str The selected sentences in text order.
+        """
+        n_sentences = n_sentences or self.n_sentences
+        sentences = split_sentences(text)
+        if len(sentences) <= n_sentences:
+            return ' '.join(sentences) or ' '.join(text.split())
+
+        scores = textrank_scores(self.vectorize(sentences), self.damping, self.min_similarity)
+        selected = np.sort(top_k(scores, n_sentences))
+
+        return ' '.join(sentences[index] for index in selected)
@@ -0,0 +1,38 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int = None) -> np.ndarray:
+    """
+    Get the indexes of the k highest scores in descending order. Ties are broken by the lowest index.
+    :param scores: np.ndarray The scores.
+    :param k: int Number of indexes to return, all of them when None.
+    :return: indexes: np.ndarray The indexes of the highest scores.
+    """
+    n = len(scores)
+    if k is None or k >= n:
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Only sort the scores that can be in the top k
+    threshold = np.partition(scores, n - k)[n - k]
+    candidates = np.flatnonzero(scores >= threshold)
+    order = np.argsort(-scores[candidates], kind='stable')[:k]
+
+    return candidates[order]
+
+
+def merge_top_k(indexes: np.ndarray, scores: np.ndarray, k: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge partial rankings into a single one with the same order as top_k.
+    :param indexes: np.ndarray The indexes of all the partial rankings.
+    :param scores: np.ndarray The scores of the indexes.
+    :param k: int Number of indexes to return, all of them when None.
+    :return: indexes: np.ndarray The merged indexes.
+             scores: np.ndarray The scores of the merged indexes.
+    """
+    order = np.lexsort((indexes, -scores))[:k]
+
+    return indexes[order], scores[order]
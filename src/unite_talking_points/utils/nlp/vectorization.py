@@ -1,29 +1,219 @@
-from typing import List, Dict, Any
+import heapq
+import json
+import os
+import shutil
+from collections import Counter
+from itertools import groupby
+from numbers import Integral
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Union
 
-import spacy
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 
 from src.unite_talking_points.domain.entities.entities import Document
-from src.unite_talking_points.utils.nlp.misc import lemmatize_spacy
+from src.unite_talking_points.utils.nlp.analyzer import LemmaAnalyzer
+
+DEFAULT_TFIDF_ARGS = {"ngram_range": (1, 3), "min_df": 0.025, "max_df": 0.5}
+
+# TfidfVectorizer arguments that CountVectorizer does not accept, and arguments applied once the corpus is merged
+TFIDF_ONLY_ARGS = ("norm", "use_idf", "smooth_idf", "sublinear_tf")
+PRUNING_ARGS = ("min_df", "max_df", "max_features")
 
 
 def vectorize_tfidf(documents: List[Document],
-                    tfidf_args: Dict[str, Any] = None):
+                    tfidf_args: Dict[str, Any] = None,
+                    analyzer: LemmaAnalyzer = None):
     """
     Vectorize a list of documents using TF-IDF.
     :param documents: List[Document] A list of documents to be vectorized.
     :param tfidf_args: Dict[str, Any] TF-IDF scikit-learn parameters.
+    :param analyzer: LemmaAnalyzer The analyzer used to lemmatize the documents. It is fitted and bound to the
+    vectorizer so it can be reused at query time.
     :return: tfidf_matrix Sparse matrix of TF-IDF values.
              tfidf_vectorizer TF-IDF sklearn vectorizer.
     """
     # Preprocess and extract the lemmas from each document
     if tfidf_args is None:
-        tfidf_args = {"ngram_range": (1, 3), "min_df": 0.025, "max_df": 0.5}
-    nlp = spacy.load("en_core_web_sm")
-    lemmatized_documents = (lemmatize_spacy(document.content, nlp) for document in documents)
+        tfidf_args = DEFAULT_TFIDF_ARGS
+    if analyzer is None:
+        analyzer = LemmaAnalyzer()
+    lemmatized_documents = analyzer.fit_lemmatize(document.content for document in documents)
 
     # Vectorize each document
+    tfidf_matrix, tfidf_vectorizer = fit_tfidf(lemmatized_documents, tfidf_args)
+    analyzer.bind(tfidf_vectorizer)
+
+    return tfidf_matrix, tfidf_vectorizer
+
+
+def fit_tfidf(lemmatized_documents: Iterable[str], tfidf_args: Dict[str, Any] = None):
+    """
+    Fit a TF-IDF vectorizer on already lemmatized documents.
+    :param lemmatized_documents: Iterable[str] The lemmatized documents.
+    :param tfidf_args: Dict[str, Any] TF-IDF scikit-learn parameters.
+    :return: tfidf_matrix Sparse matrix of TF-IDF values.
+             tfidf_vectorizer TF-IDF sklearn vectorizer.
+    """
+    if tfidf_args is None:
+        tfidf_args = DEFAULT_TFIDF_ARGS
+
     tfidf_vectorizer = TfidfVectorizer(**tfidf_args)
     tfidf_matrix = tfidf_vectorizer.fit_transform(lemmatized_documents)
 
     return tfidf_matrix, tfidf_vectorizer
+
+
+def count_document_frequencies(lemmatized_documents: Iterable[str],
+                               tfidf_args: Dict[str, Any] = None) -> Tuple[Counter, int]:
+    """
+    Count in how many documents every term appears, without pruning the vocabulary.
+
+    The counts of several parts of a corpus can be added and passed to build_tfidf_vectorizer, which gives the same
+    vectorizer as fitting TfidfVectorizer on the whole corpus.
+    :param lemmatized_documents: Iterable[str] The lemmatized documents.
+    :param tfidf_args: Dict[str, Any] TF-IDF scikit-learn parameters.
+    :return: document_frequencies: Counter The number of documents where each term appears.
+             n_documents: int The number of documents.
+    """
+    if tfidf_args is None:
+        tfidf_args = DEFAULT_TFIDF_ARGS
+    if tfidf_args.get("max_features") is not None:
+        raise ValueError("max_features is not supported when merging document frequencies")
+
+    lemmatized_documents = list(lemmatized_documents)
+    if not lemmatized_documents:
+        return Counter(), 0
+
+    count_args = {key: value for key, value in tfidf_args.items() if key not in TFIDF_ONLY_ARGS + PRUNING_ARGS}
+    count_vectorizer = CountVectorizer(**count_args)
+    count_matrix = count_vectorizer.fit_transform(lemmatized_documents)
+
+    document_frequencies = np.bincount(count_matrix.indices, minlength=count_matrix.shape[1])
+    terms = count_vectorizer.get_feature_names_out()
+
+    return Counter(dict(zip(terms, document_frequencies.tolist()))), count_matrix.shape[0]
+
+
+class DocumentFrequencyCounter:
+    """
+    Add up the document frequencies of the parts of a corpus keeping at most max_terms terms in memory.
+
+    When the counts in memory reach max_terms they are written to a run file sorted by term and cleared. The runs are
+    merged term by term when the frequencies are read, so the memory does not grow with the number of distinct terms
+    of the corpus, which is large with n-grams.
+    """
+
+    def __init__(self, directory: str, max_terms: int = 1000000):
+        """
+        :param directory: str Directory of the run files. It is created if it does not exist and removed by close.
+        :param max_terms: int Maximum number of terms counted in memory before writing a run.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_terms = max_terms
+        self.n_documents = 0
+
+        self._document_frequencies = Counter()
+        self._run_paths: List[str] = []
+
+    def update(self, document_frequencies: Counter, n_documents: int) -> None:
+        """
+        Add the document frequencies of a part of the corpus.
+        :param document_frequencies: Counter The number of documents of the part where each term appears.
+        :param n_documents: int The number of documents of the part.
+        :return:
+        """
+        self._document_frequencies.update(document_frequencies)
+        self.n_documents += n_documents
+        if len(self._document_frequencies) >= self.max_terms:
+            self._write_run()
+
+    def _write_run(self) -> None:
+        path = os.path.join(self.directory, f'{len(self._run_paths)}.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            for term in sorted(self._document_frequencies):
+                file.write(json.dumps([term, self._document_frequencies[term]]) + '\n')
+
+        self._run_paths.append(path)
+        self._document_frequencies.clear()
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Tuple[str, int]]:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                term, frequency = json.loads(line)
+                yield term, frequency
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        """
+        Merge the runs.
+        :return: document_frequencies: Iterator[Tuple[str, int]] Every term once with its document frequency in the
+        whole corpus, sorted by term.
+        """
+        if self._document_frequencies or not self._run_paths:
+            self._write_run()
+
+        runs = heapq.merge(*(self._read_run(path) for path in self._run_paths), key=lambda item: item[0])
+        for term, items in groupby(runs, key=lambda item: item[0]):
+            yield term, sum(frequency for _, frequency in items)
+
+    def close(self) -> None:
+        """
+        Remove the run files.
+        :return:
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._run_paths = []
+        self._document_frequencies.clear()
+
+
+def build_tfidf_vectorizer(document_frequencies: Union[Counter, Iterable[Tuple[str, int]]],
+                           n_documents: int,
+                           tfidf_args: Dict[str, Any] = None) -> TfidfVectorizer:
+    """
+    Build a fitted TF-IDF vectorizer from the document frequencies of a corpus. Only the terms kept after pruning are
+    held in memory, so the frequencies can be streamed.
+    :param document_frequencies: Union[Counter, Iterable[Tuple[str, int]]] The number of documents where each term
+    appears, as a Counter or as (term, frequency) pairs with every term once.
+    :param n_documents: int The number of documents of the corpus.
+    :param tfidf_args: Dict[str, Any] TF-IDF scikit-learn parameters.
+    :return: tfidf_vectorizer TF-IDF sklearn vectorizer.
+    """
+    if tfidf_args is None:
+        tfidf_args = DEFAULT_TFIDF_ARGS
+
+    # Prune the vocabulary as scikit-learn does
+    max_df = tfidf_args.get("max_df", 1.0)
+    min_df = tfidf_args.get("min_df", 1)
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_documents
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_documents
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    if isinstance(document_frequencies, Counter):
+        document_frequencies = document_frequencies.items()
+    kept_frequencies = sorted((term, frequency) for term, frequency in document_frequencies
+                              if min_doc_count <= frequency <= max_doc_count)
+    terms = [term for term, _ in kept_frequencies]
+    if not terms:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    # Fix the vocabulary and transfer the inverse document frequencies
+    vectorizer_args = {key: value for key, value in tfidf_args.items() if key not in PRUNING_ARGS}
+    tfidf_vectorizer = TfidfVectorizer(vocabulary={term: index for index, term in enumerate(terms)},
+                                       **vectorizer_args)
+    tfidf_vectorizer.fit([''])
+
+    if tfidf_vectorizer.use_idf:
+        dtype = tfidf_vectorizer.dtype if tfidf_vectorizer.dtype in (np.float64, np.float32) else np.float64
+        frequencies = np.array([frequency for _, frequency in kept_frequencies], dtype=dtype)
+
+        # Same smoothing as scikit-learn's TfidfTransformer
+        frequencies += float(tfidf_vectorizer.smooth_idf)
+        idf = np.full_like(frequencies, fill_value=n_documents + int(tfidf_vectorizer.smooth_idf), dtype=dtype)
+        idf /= frequencies
+        np.log(idf, out=idf)
+        idf += 1.0
+        tfidf_vectorizer.idf_ = idf
+
+    return tfidf_vectorizer